@@ -1,30 +1,51 @@
 import json
-from typing import Dict, Any, List
+import random
+from typing import Dict, Any, List, Optional
 from agent import Agent
+import output_classifier
+import prompt_builder
 import config
 import logging
 
 logger = logging.getLogger(__name__)
 
-with open('system_messages.json', 'r') as f:
-    system_messages = json.load(f)
-
 class Command_Monitor(Agent):
     def __init__(self, api_key: str):
         super().__init__("Command_Monitor", api_key)
 
-    def monitor_output(self, target_ip: str, scan_description: str, command_output: str, executed_commands: List[str], pending_commands: List[str]) -> Dict[str, Any]:
-        """Monitor command output and determine if input is required."""
-        system_message = system_messages["Command_Monitor"]["monitor_output"]
-        
-        user_message = f"Target IP: {target_ip}\nScan Description: {scan_description}\nCommand Output:\n{command_output}\nExecuted Commands: {json.dumps(executed_commands)}\nPending Commands: {json.dumps(pending_commands)}\n\nAnalyze the command output and determine if input is required or if the command is still running or loading up. Respond with your analysis in JSON format, using the 'input_needed' key as a boolean value."
+    def monitor_output(self, target_ip: str, scan_description: str, command_output: str, executed_commands: List[str], pending_commands: List[str], state: Optional[str] = None, exit_status: Optional[int] = None) -> Dict[str, Any]:
+        """Monitor command output and determine if input is required.
+
+        When `state` is given, `command_output` only holds the output produced since the last
+        check by the last of `executed_commands`, and `state` summarizes what was executed and
+        found before it. When `exit_status` is
+        known, obvious cases are decided locally without calling the model.
+        """
+        local_verdict = output_classifier.classify_output(command_output, exit_status)
+        # Audits sample fast-path decisions, so there is nothing to audit when the fast path is off
+        audit = config.MONITOR_FASTPATH_ENABLED and local_verdict["confident"] and random.random() < config.MONITOR_FASTPATH_AUDIT_RATE
+        if config.MONITOR_FASTPATH_ENABLED and local_verdict["confident"] and not audit:
+            output_classifier.stats.record_fast_path()
+            verdict = {"input_needed": local_verdict["input_needed"], "reason": local_verdict["reason"]}
+            self.print_agent_output(text=json.dumps(verdict))
+            return verdict
+
+        system_message = prompt_builder.system_prompt(self.name)
+        if state is not None:
+            # The run state only covers earlier commands, so name the one that produced the new output
+            current_command = executed_commands[-1] if executed_commands else None
+            sections = [("Run State", state), ("Pending Commands", json.dumps(pending_commands)), ("Current Command", current_command), ("New Output Since Last Check", command_output)]
+        else:
+            sections = [("Executed Commands", json.dumps(executed_commands)), ("Pending Commands", json.dumps(pending_commands)), ("Command Output", command_output)]
+        user_message = prompt_builder.user_prompt("monitor_output", [("Target IP", target_ip), ("Scan Description", scan_description), *sections])
         
         try:
-            command_monitor_response = self.generate_response("Command_Monitor", user_message, system_message, response_format={"type": "json_object"})
+            command_monitor_response, model_verdict = self.generate_json("Command_Monitor", user_message, system_message, until_keys=["input_needed"], method="monitor_output")
             self.add_to_chat_history("Command_Monitor", "user", user_message)
             self.add_to_chat_history("Command_Monitor", "assistant", command_monitor_response)
             self.print_agent_output(text=command_monitor_response)
-            return json.loads(command_monitor_response)
+            output_classifier.stats.record_model_call(local_verdict, model_verdict, audit=audit)
+            return model_verdict
         except Exception as e:
             logger.error(f"Error monitoring output: {str(e)}")
             raise
@@ -1,20 +1,59 @@
+import hashlib
 import json
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from agent import Agent
+import findings_chunks
+import llm_client
+import prompt_builder
+import report_sections
+from tracing import tracer
 import config
 import logging
 
 logger = logging.getLogger(__name__)
 
-with open('system_messages.json', 'r') as f:
-    system_messages = json.load(f)
-
 class Reporter(Agent):
     def __init__(self, api_key: str):
         super().__init__("Reporter", api_key)
+        self.chunk_summaries: Dict[str, str] = {}
+
+    def summarize_chunks(self, target_ip: str, scan_description: str, chunks: List[str]) -> List[str]:
+        """Summarize findings chunks concurrently, reusing summaries of chunks already summarized in earlier rounds."""
+        system_message = prompt_builder.system_prompt(self.name)
+        keys = [hashlib.sha256(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+        pending = {key: chunk for key, chunk in zip(keys, chunks) if key not in self.chunk_summaries}
+
+        if pending:
+            logger.info(f"{self.name}: Summarizing {len(pending)} of {len(chunks)} findings chunks")
+            coros = [
+                # Each chunk gets its own conversation so the concurrent calls do not share a chat history
+                self.agenerate_response(
+                    f"Findings {key[:12]}",
+                    prompt_builder.user_prompt("summarize_findings", [
+                        ("Target IP", target_ip),
+                        ("Scan Description", scan_description),
+                        (f"Findings (part {keys.index(key) + 1} of {len(chunks)})", chunk)
+                    ]),
+                    system_message,
+                    method="summarize_findings"
+                )
+                for key, chunk in pending.items()
+            ]
+            try:
+                with tracer.span(f"{self.name}.summarize_findings", "llm", chunks=len(pending)):
+                    summaries = llm_client.gather(*coros)
+            except Exception as e:
+                logger.error(f"Error summarizing findings: {str(e)}")
+                raise
+            self.chunk_summaries.update(zip(pending, (summary.strip() for summary in summaries)))
+
+        return [self.chunk_summaries[key] for key in keys]
 
     def generate_report(self, target_ip: str, scan_description: str, findings_file: str, feedback: Optional[str] = None) -> str:
-        """Generate a comprehensive findings report based on the vulnerability scan findings."""
+        """Generate a comprehensive findings report based on the vulnerability scan findings.
+
+        Findings larger than one chunk are summarized chunk by chunk first, and the report is written from the summaries.
+        """
         try:
             with open(findings_file, "r") as f:
                 findings = json.load(f)
@@ -22,15 +61,26 @@ class Reporter(Agent):
             logger.error(f"Error reading findings file: {str(e)}")
             raise
 
-        system_message = system_messages["Reporter"]["generate_report"]
-        
-        user_message = f"Target IP: {target_ip}\nScan Description: {scan_description}\nFindings File: {json.dumps(findings, indent=2)}\n\nPlease generate a comprehensive findings report based on the provided vulnerability scan findings. Use Markdown formatting for the report."
-        
-        if feedback:
-            user_message += f"\n\nFeedback from Manager: {feedback}\n\nPlease update the findings report based on the provided feedback, ensuring that the report is comprehensive, professional, and addresses all the necessary aspects."
+        system_message = prompt_builder.system_prompt(self.name)
+
+        chunks = findings_chunks.chunk_findings(findings, config.REPORT_CHUNK_TOKENS)
+        if len(chunks) <= 1:
+            findings_section = ("Findings", chunks[0] if chunks else "")
+        else:
+            summaries = self.summarize_chunks(target_ip, scan_description, chunks)
+            findings_section = ("Findings Summaries (one per part of the findings, in order)", "\n" + "\n\n".join(
+                f"### Part {index} of {len(summaries)}\n{summary}" for index, summary in enumerate(summaries, 1)
+            ))
+
+        user_message = prompt_builder.user_prompt("generate_report", [
+            ("Target IP", target_ip),
+            ("Scan Description", scan_description),
+            findings_section,
+            ("Feedback from Manager", feedback or None)
+        ])
 
         try:
-            report = self.generate_response("Manager", user_message, system_message)
+            report = self.generate_response("Manager", user_message, system_message, method="generate_report")
             self.add_to_chat_history("Manager", "user", user_message)
             self.add_to_chat_history("Manager", "assistant", report)
             self.print_agent_output(text=report)
@@ -38,3 +88,29 @@ class Reporter(Agent):
         except Exception as e:
             logger.error(f"Error generating report: {str(e)}")
             raise
+
+    def revise_sections(self, report: str, section_ids: List[str], feedback: str) -> str:
+        """Regenerate only the named sections of a report and splice them back in."""
+        sections = report_sections.split_sections(report)
+        requested = [section for section in sections if section["id"] in section_ids]
+        if not requested:
+            return report
+
+        system_message = prompt_builder.system_prompt(self.name)
+        current_text = "\n\n".join(f"Section id: {section['id']}\n{section['text'].strip()}" for section in requested)
+        user_message = prompt_builder.user_prompt("revise_sections", [
+            ("Report Sections (id: title)", report_sections.render_outline(sections)),
+            ("Feedback from Manager", feedback),
+            ("Sections to revise", current_text)
+        ])
+
+        try:
+            _, response = self.generate_json("Manager", user_message, system_message, method="revise_sections")
+            revised: Dict[str, Any] = response["sections"]
+            revised = {section_id: text.strip() + "\n\n" for section_id, text in revised.items() if section_id in section_ids and isinstance(text, str)}
+            report = report_sections.join_sections(report_sections.replace_sections(sections, revised))
+            self.print_agent_output(text=report)
+            return report
+        except Exception as e:
+            logger.error(f"Error revising report sections: {str(e)}")
+            raise
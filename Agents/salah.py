@@ -1,9 +1,24 @@
+import codecs
+import itertools
 import json
+import os
+import re
 import paramiko
+import select
+import threading
 import time
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from agent import Agent
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import checkpoint
+import command_cache
+import command_graph
+import run_log
+import ssh_pool
+import tool_parsers
+from rolling_state import RollingState
+from terminal_normalizer import TerminalNormalizer
+from metrics import metrics
+from tracing import tracer
 import config
 import logging
 
@@ -12,7 +27,23 @@ logger = logging.getLogger(__name__)
 with open('system_messages.json', 'r') as f:
     system_messages = json.load(f)
 
+class CommandTimeoutError(Exception):
+    """Raised when a command runs past its time budget; carries the output read before it was stopped."""
+
+    def __init__(self, command: str, timeout: float, partial_output: str):
+        super().__init__(f"Command timed out after {timeout:.0f}s and was stopped; its output is incomplete")
+        self.command = command
+        self.timeout = timeout
+        self.partial_output = partial_output
+
+
+class StrategyTimeoutError(Exception):
+    """Raised when the time budget of a strategy runs out before a command could start."""
+
+
 class Salah(Agent):
+    _raw_sequence = itertools.count(1)
+
     def __init__(self, api_key: str):
         super().__init__("Salah", api_key)
 
@@ -27,145 +58,504 @@ class Salah(Agent):
                         parts[i] = f'{prefix}="{script}"'
                     else:
                         parts[i+1] = f'"{parts[i+1]}"'
-            return ' '.join(parts)
+            command = ' '.join(parts)
+        if config.TOOL_PARSERS_ENABLED and config.NMAP_REQUEST_XML:
+            command = tool_parsers.request_machine_format(command)
         return command
 
-    def execute_command(self, ssh: paramiko.SSHClient, prepared_command: str) -> Tuple[str, int]:
-        command_output = ""
+    def structure_output(self, prepared_command: str, command_output: str) -> Tuple[str, List[str]]:
+        """Turn the output of a known tool into a compact structured record for the models.
+
+        Returns the text to pass on and the key facts found by the parser. The output of chained
+        commands also holds the output of the other commands, so it is passed on unchanged.
+        """
+        if not config.TOOL_PARSERS_ENABLED:
+            return command_output, []
+        record = tool_parsers.parse_output(prepared_command, command_output)
+        if record is None:
+            return command_output, []
+        if not tool_parsers.is_simple_command(prepared_command):
+            return command_output, tool_parsers.record_facts(record)
+        return tool_parsers.render_record(record, command_output), tool_parsers.record_facts(record)
+
+    @staticmethod
+    def command_timeout(deadline: Optional[float]) -> float:
+        """Get the time budget of the next command: COMMAND_TIMEOUT, capped by what is left until the strategy deadline.
+
+        Raises StrategyTimeoutError if the strategy deadline has passed.
+        """
+        timeout = float(config.COMMAND_TIMEOUT)
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise StrategyTimeoutError(f"Strategy time budget of {config.STRATEGY_TIMEOUT}s exhausted")
+        return min(timeout, remaining) if timeout else remaining
+
+    def execute_command(self, ssh: paramiko.SSHClient, prepared_command: str, timeout: Optional[float] = None) -> Tuple[str, int]:
+        """Execute a command and stream its output until it exits.
+
+        Raises CommandTimeoutError if it runs longer than `timeout` seconds (default
+        config.COMMAND_TIMEOUT, 0 for no limit).
+        """
+        start_time = time.monotonic()
         exit_status = None
+        output_bytes = 0
+        try:
+            with tracer.span("command", "ssh", command=prepared_command):
+                with ssh_pool.session_slot():
+                    command_output, exit_status = self.read_command_output(ssh, prepared_command, config.COMMAND_TIMEOUT if timeout is None else timeout)
+            output_bytes = len(command_output.encode('utf-8'))
+            return command_output, exit_status
+        finally:
+            metrics.record_command(self.name, prepared_command, time.monotonic() - start_time, output_bytes, exit_status, target=self.log_subdir)
+
+    def run_strategy_command(self, ssh: paramiko.SSHClient, prepared_command: str, target_ip: str, force: bool = False, timeout: Optional[float] = None) -> Tuple[str, int, bool]:
+        """Execute a strategy command, reusing the result of an identical successful command on the same target unless forced.
+
+        Returns the output, the exit status and whether the result came from the cache.
+        """
+        cache = command_cache.get_cache()
+        if cache and not force:
+            cached = cache.get(target_ip, prepared_command)
+            if cached is not None:
+                logger.info(f"{self.name}: Reusing cached result of: {prepared_command}")
+                return cached[0], cached[1], True
+        command_output, exit_status = self.execute_command(ssh, prepared_command, timeout)
+        if cache and exit_status == 0:
+            cache.put(target_ip, prepared_command, command_output, exit_status)
+        return command_output, exit_status, False
 
+    def read_command_output(self, ssh: paramiko.SSHClient, prepared_command: str, timeout: float = 0) -> Tuple[str, int]:
+        """Start a command on a new channel and read its output until it exits.
+
+        Once `timeout` seconds have passed (0 for no limit), the command is interrupted with Ctrl-C,
+        given COMMAND_TIMEOUT_GRACE seconds to exit, and then its channel is closed, which hangs up
+        the remote process. CommandTimeoutError is raised with the output read so far.
+        """
         stdin, stdout, stderr = ssh.exec_command(prepared_command, get_pty=True)
-        
-        while not (stdout.channel.exit_status_ready() and stdout.channel.recv_ready() == False):
-            if stdout.channel.recv_ready():
-                chunk = stdout.channel.recv(1024).decode('utf-8', errors='replace')
+        channel = stdout.channel
+
+        output_buffer = bytearray()
+        error_buffer = bytearray()
+        output_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        error_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        # Repeated lines are significant in XML (e.g. consecutive closing tags), so keep them all
+        output_normalizer = TerminalNormalizer(collapse_runs=not tool_parsers.writes_machine_format(prepared_command))
+        error_normalizer = TerminalNormalizer()
+        deadline = time.monotonic() + timeout if timeout else None
+        timed_out = False
+
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                if timed_out:
+                    break
+                timed_out = True
+                logger.warning(f"{self.name}: Command exceeded its {timeout:.0f}s budget, interrupting: {prepared_command}")
+                try:
+                    channel.send(b'\x03')
+                except Exception as e:
+                    logger.warning(f"{self.name}: Could not interrupt command: {str(e)}")
+                deadline = time.monotonic() + config.COMMAND_TIMEOUT_GRACE
+
+            if channel.recv_ready():
+                data = channel.recv(config.SSH_READ_CHUNK_SIZE)
+                output_buffer += data
+                chunk = output_decoder.decode(data)
                 if chunk:
-                    command_output += chunk
                     print(f"{self.name}: {chunk}", end='')
-                    
-            if stderr.channel.recv_stderr_ready():
-                error_chunk = stderr.channel.recv_stderr(1024).decode('utf-8', errors='replace')
+                    output_normalizer.feed(chunk)
+                continue
+
+            if channel.recv_stderr_ready():
+                data = channel.recv_stderr(config.SSH_READ_CHUNK_SIZE)
+                error_buffer += data
+                error_chunk = error_decoder.decode(data)
                 if error_chunk:
-                    command_output += error_chunk
                     print(f"{self.name} Error: {error_chunk}", end='')
-            
-            time.sleep(0.01)
+                    error_normalizer.feed(error_chunk)
+                continue
+
+            if channel.exit_status_ready() or channel.closed:
+                break
+
+            # Sleep until paramiko signals new data on the channel
+            select.select([channel], [], [], config.SSH_SELECT_TIMEOUT)
+
+        if timed_out:
+            channel.close()
+            exit_status = -1
+        else:
+            exit_status = channel.recv_exit_status()
+        if not config.TERMINAL_NORMALIZE:
+            command_output = output_buffer.decode('utf-8', errors='replace') + error_buffer.decode('utf-8', errors='replace')
+            if timed_out:
+                raise CommandTimeoutError(prepared_command, timeout, command_output)
+            return command_output, exit_status
+
+        output_normalizer.feed(output_decoder.decode(b'', final=True))
+        error_normalizer.feed(error_decoder.decode(b'', final=True))
+        command_output = output_normalizer.finish()
+        error_output = error_normalizer.finish()
+        if error_output:
+            command_output = f"{command_output}\n{error_output}" if command_output else error_output
+        if config.TERMINAL_KEEP_RAW:
+            self.save_raw_output(prepared_command, bytes(output_buffer + error_buffer))
+        if timed_out:
+            raise CommandTimeoutError(prepared_command, timeout, command_output)
+        return command_output, exit_status
+
+    def save_raw_output(self, prepared_command: str, data: bytes) -> None:
+        """Keep the raw bytes of a command's terminal output in the run's raw/ directory for auditing."""
+        raw_dir = os.path.join(config.LOG_DIR, f"run{self.run_number}", self.log_subdir, run_log.RAW_DIR)
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", prepared_command)[:60].strip("_")
+        path = os.path.join(raw_dir, f"{next(Salah._raw_sequence):04d}_{slug}.log")
+        run_log.get_writer().write_blob(path, data)
+        logger.info(f"{self.name}: Raw output of '{prepared_command}' saved to {path}")
+
+    def handle_command_error(self, ssh: paramiko.SSHClient, command: str, error: Exception, partial_output: str, output: str, target_ip: str, scan_description: str, kofahi: Agent, deadline: Optional[float] = None) -> str:
+        """Ask the Debugger for a fix, run the fix commands and return the output to append.
+
+        Fix commands share the strategy's time budget: each is limited like a strategy command, and
+        the remaining fixes are skipped once `deadline` has passed.
+        """
+        appended_output = ""
+        error_message = f"Error executing command: {command}\nError message: {str(error)}\n\n"
+        logger.error(f"{self.name}: {error_message}")
+        
+        error_log_entry = {
+            "command": command,
+            "error": str(error),
+            "partial_output": partial_output
+        }
+        self.print_agent_output(text=json.dumps(error_log_entry))
         
-        exit_status = stdout.channel.recv_exit_status()
+        context = f"Target IP: {target_ip}\nScan Description: {scan_description}\nCommand Output:\n{output}{partial_output}"
+        kofahi_response = kofahi.handle_error(error_message, context)
+        self.add_to_chat_history("Kofahi", "user", f"Error Message:\n{error_message}\n\nContext:\n{context}")
+        self.add_to_chat_history("Kofahi", "assistant", json.dumps(kofahi_response))
+        
+        if "fix" in kofahi_response:
+            fix_commands = kofahi_response["fix"]
+            logger.info(f"{self.name}: Executing fix commands:")
+            
+            for fix_index, fix_command in enumerate(fix_commands):
+                logger.info(f"{self.name}: {fix_command}")
+                try:
+                    timeout = self.command_timeout(deadline)
+                except StrategyTimeoutError as e:
+                    skipped_message = f"{str(e)}; skipped fix commands: {json.dumps(fix_commands[fix_index:])}\n\n"
+                    logger.warning(f"{self.name}: {skipped_message}")
+                    appended_output += skipped_message
+                    break
+                try:
+                    prepared_fix_command = self.prepare_command(fix_command)
+                    
+                    fix_output, fix_exit_status = self.execute_command(ssh, prepared_fix_command, timeout)
+                    
+                    fix_log_entry = {
+                        "command": prepared_fix_command,
+                        "raw_output": fix_output,
+                        "type": "fix_command",
+                        "exit_status": fix_exit_status
+                    }
+                    self.print_agent_output(text=json.dumps(fix_log_entry))
+                    
+                    appended_output += fix_output
+                except Exception as e:
+                    logger.error(f"{self.name}: Error executing fix command: {fix_command}")
+                    logger.error(f"{self.name}: Error message: {str(e)}")
+                    fix_error_entry = {
+                        "command": fix_command,
+                        "error": str(e),
+                        "type": "fix_command"
+                    }
+                    self.print_agent_output(text=json.dumps(fix_error_entry))
+
+        if partial_output:
+            appended_output = partial_output.rstrip("\n") + "\n" + appended_output
+        appended_output += error_message
+        return appended_output
+
+    def monitor_command(self, ssh: paramiko.SSHClient, prepared_command: str, command_output: str, exit_status: int, facts: List[str], output: str, executed_commands: List[str], pending_commands: List[Any], state: RollingState, target_ip: str, scan_description: str, ammar: Agent, rakan: Agent, deadline: Optional[float] = None) -> Tuple[bool, Optional[Tuple[str, str, int]]]:
+        """Ask the Command_Monitor whether a finished command needs input and run the input the Strategist gives.
+
+        The command is recorded in `state`. Returns whether input was needed and the prepared
+        command, output and exit status of the input command (None if the Strategist gave none).
+        """
+        if config.MONITOR_MODE == 'delta':
+            rakan_response = rakan.monitor_output(target_ip, scan_description, command_output, executed_commands, pending_commands, state=state.render(), exit_status=exit_status)
+        else:
+            rakan_response = rakan.monitor_output(target_ip, scan_description, output, executed_commands, pending_commands, exit_status=exit_status)
+
+        state.record(prepared_command, exit_status, command_output, facts)
+
+        if not rakan_response["input_needed"]:
+            return False, None
+
+        if config.MONITOR_MODE == 'delta':
+            ammar_response = ammar.generate_input(target_ip, scan_description, command_output, pending_commands, state=state.render())
+        else:
+            ammar_response = ammar.generate_input(target_ip, scan_description, output, pending_commands)
+        input_command = ammar_response["input"]
+        if not input_command:
+            return True, None
+
+        prepared_input_command = self.prepare_command(input_command)
+        logger.info(f"{self.name}: Executing input command: {prepared_input_command}")
+
+        input_output, input_exit_status = self.execute_command(ssh, prepared_input_command, self.command_timeout(deadline))
+
+        input_log_entry = {
+            "command": prepared_input_command,
+            "raw_output": input_output,
+            "type": "input_command",
+            "exit_status": input_exit_status
+        }
+        self.print_agent_output(text=json.dumps(input_log_entry))
+        return True, (prepared_input_command, input_output, input_exit_status)
+
+    def execute_command_graph(self, ssh: paramiko.SSHClient, commands: List[Any], target_ip: str, scan_description: str, kofahi: Agent, ammar: Agent, rakan: Agent, progress: Optional[Dict[str, Any]] = None, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None, deadline: Optional[float] = None) -> str:
+        """Execute dependency-aware strategy commands concurrently over separate channels of one connection.
+
+        Plain string commands run one after another in strategy order and go through the
+        Command_Monitor like in sequential execution: an input command takes the place of the next
+        plain string, and if input is needed but none is given the remaining plain strings are not
+        run. Outputs are merged in strategy order regardless of completion order. Results of
+        completed commands are kept in `progress["nodes"]` (None for plain strings that were not
+        run), and commands already found there are not re-run. Commands that cannot start before
+        `deadline` are skipped.
+        """
+        nodes = command_graph.parse_commands(commands)
+        parent_span = tracer.current_span_id()
+        completed_nodes = progress.setdefault("nodes", {}) if progress is not None else {}
+        progress_lock = threading.Lock()
+        structured_outputs: Dict[str, str] = {}
+        state = RollingState()
+
+        for node in nodes:
+            if completed_nodes.get(node["id"]):
+                prepared_command, command_output, exit_status, input_output = completed_nodes[node["id"]]
+                structured_output, facts = self.structure_output(prepared_command, command_output)
+                structured_outputs[node["id"]] = structured_output + input_output
+                state.record(prepared_command, exit_status, command_output, facts)
+
+        def save_node(node_id: str, result: Optional[List[Any]]) -> None:
+            completed_nodes[node_id] = result
+            if on_progress:
+                on_progress({"node": node_id, "result": result})
+
+        def run_node(node: Dict[str, Any]) -> Optional[Tuple[str, str, int, str]]:
+            with progress_lock:
+                if node["id"] in completed_nodes:
+                    result = completed_nodes[node["id"]]
+                    if result is not None:
+                        logger.info(f"{self.name}: Reusing result of completed command [{node['id']}]")
+                    return tuple(result) if result is not None else None
+            # Runs on a worker thread, so the parent span is passed explicitly
+            with tracer.span(f"graph_node:{node['id']}", "ssh", parent_id=parent_span, depends_on=node["depends_on"]):
+                timeout = self.command_timeout(deadline)
+                command, force = command_cache.split_force_marker(node["command"])
+                prepared_command = self.prepare_command(command)
+                logger.info(f"{self.name}: Executing command [{node['id']}]: {prepared_command}")
+                command_output, exit_status, _ = self.run_strategy_command(ssh, prepared_command, target_ip, force=force or bool(node.get("force")), timeout=timeout)
+                structured_output, facts = self.structure_output(prepared_command, command_output)
+                result = [prepared_command, command_output, exit_status, ""]
+                with progress_lock:
+                    structured_outputs[node["id"]] = structured_output
+                    # Saved before the monitor calls, so a crash in between does not run it again on resume
+                    save_node(node["id"], result)
+                    if not node.get("sequential"):
+                        state.record(prepared_command, exit_status, command_output, facts)
+                        return tuple(result)
+                    position = nodes.index(node)
+                    output = "".join(structured_outputs.get(other["id"], "") for other in nodes)
+                    executed_commands = [command_cache.split_force_marker(other["command"])[0] for other in nodes if completed_nodes.get(other["id"])]
+                    pending_commands = [other["command"] for other in nodes[position + 1:] if other["id"] not in completed_nodes]
+                    node_state = RollingState.from_dict(state.to_dict())
+
+                try:
+                    input_needed, input_result = self.monitor_command(ssh, prepared_command, command_output, exit_status, facts, output, executed_commands, pending_commands, node_state, target_ip, scan_description, ammar, rakan, deadline)
+                except StrategyTimeoutError as e:
+                    logger.warning(f"{self.name}: {str(e)}; skipped input command of [{node['id']}]")
+                    input_needed, input_result = False, None
+                    result[3] = f"{str(e)}; skipped input command\n\n"
 
-        return command_output, exit_status or -1
+                with progress_lock:
+                    state.record(prepared_command, exit_status, command_output, facts)
+                    if input_needed:
+                        later = [other for other in nodes[position + 1:] if other.get("sequential") and other["id"] not in completed_nodes]
+                        # The input command takes the place of the next plain string; without input the sequence stops
+                        for other in (later[:1] if input_result is not None else later):
+                            save_node(other["id"], None)
+                    if input_result is not None:
+                        prepared_input_command, input_output, input_exit_status = input_result
+                        structured_input_output, input_facts = self.structure_output(prepared_input_command, input_output)
+                        state.record(prepared_input_command, input_exit_status, input_output, input_facts)
+                        result[3] = structured_input_output
+                    structured_outputs[node["id"]] += result[3]
+                    if result[3]:
+                        save_node(node["id"], result)
+            return tuple(result)
 
-    def execute_commands(self, commands: List[str], target_ip: str, scan_description: str, kofahi: Agent, ammar: Agent, rakan: Agent) -> str:
+        results = command_graph.run_graph(nodes, run_node, config.SSH_MAX_PARALLEL_COMMANDS)
+
+        output = ""
+        for node in nodes:
+            result = results[node["id"]]
+            if result["status"] == "done" and result["result"] is None:
+                continue
+            if result["status"] == "done":
+                prepared_command, command_output, exit_status, _ = result["result"]
+                log_entry = {
+                    "id": node["id"],
+                    "command": prepared_command,
+                    "raw_output": command_output,
+                    "exit_status": exit_status
+                }
+                self.print_agent_output(text=json.dumps(log_entry))
+                output += structured_outputs[node["id"]]
+            elif result["status"] == "failed" and isinstance(result["error"], StrategyTimeoutError):
+                skipped_message = f"Skipped command: {node['command']} ({str(result['error'])})\n\n"
+                logger.warning(f"{self.name}: {skipped_message}")
+                output += skipped_message
+            elif result["status"] == "failed":
+                error = result["error"]
+                output += self.handle_command_error(ssh, node["command"], error, getattr(error, "partial_output", ""), output, target_ip, scan_description, kofahi, deadline)
+            else:
+                skipped_message = f"Skipped command: {node['command']} ({result['reason']})\n\n"
+                logger.warning(f"{self.name}: {skipped_message}")
+                output += skipped_message
+
+        return output
+
+    @tracer.traced("ssh")
+    def execute_commands(self, commands: List[Any], target_ip: str, scan_description: str, kofahi: Agent, ammar: Agent, rakan: Agent, progress: Optional[Dict[str, Any]] = None, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Execute strategy commands over SSH and return the combined output.
+
+        If `progress` is given, it is updated before and after each command and `on_progress` is
+        called with a record of what changed (see checkpoint.apply_progress), so an interrupted
+        execution can be resumed from the first command that had not completed.
+        Each command is limited to COMMAND_TIMEOUT seconds and the whole strategy to STRATEGY_TIMEOUT
+        seconds; commands that time out keep their partial output and go to the Debugger. A strategy
+        whose dependencies are invalid (unknown ids, duplicates, cycles) is executed in list order.
+        """
+        deadline = time.monotonic() + config.STRATEGY_TIMEOUT if config.STRATEGY_TIMEOUT else None
         output = ""
         executed_commands = []
         pending_commands = commands.copy()
         command_index = 0
+        state = RollingState()
+
+        if progress:
+            command_index = progress.get("command_index", 0)
+            output = progress.get("output", "")
+            executed_commands = list(progress.get("executed_commands", []))
+            state = RollingState.from_dict(progress.get("rolling_state", {}))
+            logger.info(f"{self.name}: Resuming execution at command {command_index + 1} of {len(commands)}")
         
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        saved_lengths = [len(output), len(executed_commands)]
+
+        def save_progress(next_index: int, saved_state: RollingState) -> None:
+            if progress is None:
+                return
+            record = {
+                "command_index": next_index,
+                "output": output[saved_lengths[0]:],
+                "executed_commands": executed_commands[saved_lengths[1]:],
+                "rolling_state": saved_state.to_dict()
+            }
+            if next_index == progress.get("command_index") and not record["output"] and not record["executed_commands"] and record["rolling_state"] == progress.get("rolling_state"):
+                return
+            checkpoint.apply_progress(progress, record)
+            saved_lengths[:] = [len(output), len(executed_commands)]
+            if on_progress:
+                on_progress(record)
+
+        pool = ssh_pool.get_pool()
+        ssh = pool.acquire()
 
         try:
-            ssh.connect(**config.SSH_CONFIG)
             logger.info(f"{self.name}: Connected to SSH server...")
 
+            if command_graph.has_dependencies(commands):
+                try:
+                    command_graph.parse_commands(commands)
+                except ValueError as e:
+                    # The strategy comes from the model; run it in list order rather than failing the engagement
+                    logger.warning(f"{self.name}: Invalid command dependencies ({str(e)}), executing the commands in order")
+                    commands = [command for command in commands if not isinstance(command, dict) or command.get("command")]
+                else:
+                    return self.execute_command_graph(ssh, commands, target_ip, scan_description, kofahi, ammar, rakan, progress, on_progress, deadline)
+
             while command_index < len(commands):
-                command = commands[command_index]
+                save_progress(command_index, state)
+
+                command, force = command_cache.split_force_marker(commands[command_index])
+                if isinstance(command, dict):
+                    command, string_force = command_cache.split_force_marker(str(command["command"]))
+                    force = force or string_force
+                try:
+                    timeout = self.command_timeout(deadline)
+                except StrategyTimeoutError as e:
+                    skipped_message = f"{str(e)}; skipped commands: {json.dumps(commands[command_index:])}\n\n"
+                    logger.warning(f"{self.name}: {skipped_message}")
+                    output += skipped_message
+                    break
                 try:
                     prepared_command = self.prepare_command(command)
                     logger.info(f"{self.name}: Executing command: {prepared_command}")
                     
-                    command_output, exit_status = self.execute_command(ssh, prepared_command)
+                    command_output, exit_status, cached = self.run_strategy_command(ssh, prepared_command, target_ip, force=force, timeout=timeout)
                     
                     log_entry = {
                         "command": prepared_command,
                         "raw_output": command_output,
                         "exit_status": exit_status
                     }
+                    if cached:
+                        log_entry["cached"] = True
                     self.print_agent_output(text=json.dumps(log_entry))
                     
-                    output += command_output
+                    structured_output, facts = self.structure_output(prepared_command, command_output)
+                    output += structured_output
                     executed_commands.append(command)
                     pending_commands = commands[command_index+1:]
+                    if progress is not None:
+                        # Save the completed command before the monitor calls, so a crash in
+                        # between does not run it again on resume
+                        completed_state = RollingState.from_dict(state.to_dict())
+                        completed_state.record(prepared_command, exit_status, command_output, facts)
+                        save_progress(command_index + 1, completed_state)
 
-                    rakan_response = rakan.monitor_output(target_ip, scan_description, output, executed_commands, pending_commands)
-                    
-                    if rakan_response["input_needed"]:
-                        ammar_response = ammar.generate_input(target_ip, scan_description, output, pending_commands)
-                        input_command = ammar_response["input"]
-
-                        if input_command:
-                            command_index += 1
-                            prepared_input_command = self.prepare_command(input_command)
-                            logger.info(f"{self.name}: Executing input command: {prepared_input_command}")
-                            
-                            input_output, input_exit_status = self.execute_command(ssh, prepared_input_command)
-                            
-                            input_log_entry = {
-                                "command": prepared_input_command,
-                                "raw_output": input_output,
-                                "type": "input_command",
-                                "exit_status": input_exit_status
-                            }
-                            self.print_agent_output(text=json.dumps(input_log_entry))
-                            
-                            output += input_output
-                        else:
-                            command_index += 1
+                    input_needed, input_result = self.monitor_command(ssh, prepared_command, command_output, exit_status, facts, output, executed_commands, pending_commands, state, target_ip, scan_description, ammar, rakan, deadline)
+                    if input_needed:
+                        # The input command takes the place of the next command; without input the strategy stops
+                        command_index += 1
+                        if input_result is None:
                             break
+                        prepared_input_command, input_output, input_exit_status = input_result
+                        structured_input_output, input_facts = self.structure_output(prepared_input_command, input_output)
+                        output += structured_input_output
+                        state.record(prepared_input_command, input_exit_status, input_output, input_facts)
 
                     command_index += 1
 
+                except StrategyTimeoutError as e:
+                    # The budget ran out before an input command could start; the Debugger cannot help with that
+                    skipped_message = f"{str(e)}; skipped commands: {json.dumps(commands[command_index:])}\n\n"
+                    logger.warning(f"{self.name}: {skipped_message}")
+                    output += skipped_message
+                    break
                 except Exception as e:
-                    error_message = f"Error executing command: {command}\nError message: {str(e)}\n\n"
-                    logger.error(f"{self.name}: {error_message}")
-                    
-                    error_log_entry = {
-                        "command": command,
-                        "error": str(e),
-                        "partial_output": command_output if 'command_output' in locals() else ""
-                    }
-                    self.print_agent_output(text=json.dumps(error_log_entry))
-                    
-                    context = f"Target IP: {target_ip}\nScan Description: {scan_description}\nCommand Output:\n{output}"
-                    kofahi_response = kofahi.handle_error(error_message, context)
-                    self.add_to_chat_history("Kofahi", "user", f"Error Message:\n{error_message}\n\nContext:\n{context}")
-                    self.add_to_chat_history("Kofahi", "assistant", json.dumps(kofahi_response))
-                    
-                    if "fix" in kofahi_response:
-                        fix_commands = kofahi_response["fix"]
-                        logger.info(f"{self.name}: Executing fix commands:")
-                        
-                        for fix_command in fix_commands:
-                            logger.info(f"{self.name}: {fix_command}")
-                            try:
-                                prepared_fix_command = self.prepare_command(fix_command)
-                                
-                                fix_output, fix_exit_status = self.execute_command(ssh, prepared_fix_command)
-                                
-                                fix_log_entry = {
-                                    "command": prepared_fix_command,
-                                    "raw_output": fix_output,
-                                    "type": "fix_command",
-                                    "exit_status": fix_exit_status
-                                }
-                                self.print_agent_output(text=json.dumps(fix_log_entry))
-                                
-                                output += fix_output
-                            except Exception as e:
-                                logger.error(f"{self.name}: Error executing fix command: {fix_command}")
-                                logger.error(f"{self.name}: Error message: {str(e)}")
-                                fix_error_entry = {
-                                    "command": fix_command,
-                                    "error": str(e),
-                                    "type": "fix_command"
-                                }
-                                self.print_agent_output(text=json.dumps(fix_error_entry))
-
-                    output += error_message
+                    output += self.handle_command_error(
+                        ssh, command, e, getattr(e, "partial_output", ""),
+                        output, target_ip, scan_description, kofahi, deadline
+                    )
                     command_index += 1
 
         finally:
-            ssh.close()
-            logger.info(f"{self.name}: SSH connection closed.")
+            pool.release(ssh)
+            logger.info(f"{self.name}: SSH connection returned to pool.")
 
         return output
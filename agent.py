@@ -1,11 +1,22 @@
-from openai import OpenAI
 from colorama import init, Fore, Style
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 import config
+import llm_client
+import llm_cache
+import model_routing
+import context_window
+import run_log
+import rate_limiter
+import response_schemas
+from incremental_json import IncrementalJSONParser
+from metrics import EstimatedUsage, metrics
+from tracing import tracer
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -13,6 +24,7 @@ logger = logging.getLogger(__name__)
 class Agent:
     run_number = 0
     global_order = 0
+    _order_lock = threading.Lock()
 
     @classmethod
     def increment_run_number(cls) -> None:
@@ -33,9 +45,12 @@ class Agent:
     def __init__(self, name: str, api_key: str):
         """Initialize an Agent instance."""
         self.name = name
-        self.client = OpenAI(api_key=api_key)
+        self.client = llm_client.get_async_client(api_key)
         self.chat_histories: Dict[str, List[Dict[str, str]]] = {}
         self.request_counter = 0
+        self.turn_summaries: Dict[str, Dict[int, str]] = {}
+        self.streamed_response: Optional[str] = None
+        self.log_subdir = ""
 
     def get_chat_history(self, recipient: str) -> List[Dict[str, str]]:
         """Get or initialize chat history for a recipient."""
@@ -50,9 +65,15 @@ class Agent:
         chat_history = self.get_chat_history(recipient)
         chat_history.append({"role": role, "content": content})
 
-    def print_agent_output(self, text: Optional[str] = None) -> None:
-        """Print agent output with color coding."""
-        color = {
+    def discard_last_exchange(self, recipient: str) -> None:
+        """Remove the last request and response from the chat history, e.g. before repeating the request."""
+        chat_history = self.get_chat_history(recipient)
+        if len(chat_history) >= 3 and chat_history[-1]["role"] == "assistant" and chat_history[-2]["role"] == "user":
+            del chat_history[-2:]
+
+    def get_output_color(self) -> str:
+        """Get the console color of this agent."""
+        return {
             "Strategist": Fore.BLUE,
             "Manager": Fore.GREEN,
             "Debugger": Fore.LIGHTGREEN_EX,
@@ -61,87 +82,230 @@ class Agent:
             "Reporter": Fore.CYAN,
             "Output": Fore.RED
         }.get(self.name, Fore.RESET)
-        
+
+    def print_agent_field(self, key: str, value: Any) -> None:
+        """Print one key of a JSON agent response."""
+        color = self.get_output_color()
+        formatted_key = key.capitalize()
+        if isinstance(value, bool):
+            formatted_value = "Yes" if value else "No"
+        elif isinstance(value, list):
+            formatted_value = ", ".join(item if isinstance(item, str) else json.dumps(item) for item in value)
+        else:
+            formatted_value = value
+        print(f"{color}{formatted_key}: {formatted_value}{Style.RESET_ALL}")
+
+    def print_agent_output(self, text: Optional[str] = None) -> None:
+        """Print agent output with color coding."""
+        if text is not None and text == self.streamed_response:
+            # Already rendered token by token while it was streamed
+            self.streamed_response = None
+            return
+
+        color = self.get_output_color()
         print(f"{color}{self.name}:{Style.RESET_ALL}")
         
         if text:
             try:
                 data = json.loads(text)
                 for key, value in data.items():
-                    formatted_key = key.capitalize()
-                    if isinstance(value, bool):
-                        formatted_value = "Yes" if value else "No"
-                    elif isinstance(value, list):
-                        formatted_value = ", ".join(value)
-                    else:
-                        formatted_value = value
-                    print(f"{color}{formatted_key}: {formatted_value}{Style.RESET_ALL}")
+                    self.print_agent_field(key, value)
             except json.JSONDecodeError:
                 print(f"{color}Text: {text}{Style.RESET_ALL}")
         
         print()
 
-    def generate_chat_messages(self, recipient: str, system_message: str, user_message: str) -> List[Dict[str, str]]:
-        """Generate chat messages for OpenAI API."""
+    def generate_chat_messages(self, recipient: str, system_message: str, model: str = config.OPENAI_MODEL) -> List[Dict[str, str]]:
+        """Generate chat messages for OpenAI API, keeping the prompt within the agent's token budget."""
         chat_history = self.get_chat_history(recipient)
-        return [
-            {"role": "system", "content": system_message},
-            *chat_history[-20:],
-            {"role": "user", "content": user_message}
-        ]
-
-    def generate_response(self, recipient: str, user_message: str, system_message: str, model: str = config.OPENAI_MODEL, response_format: Optional[Dict[str, str]] = None) -> str:
-        """Generate a response using the OpenAI API."""
+        summaries = self.turn_summaries.setdefault(recipient, {})
+        budget = context_window.get_token_budget(self.name)
+        return context_window.build_context(system_message, chat_history[1:], budget, summaries, model)
+
+    def generate_response(self, recipient: str, user_message: str, system_message: str, model: Optional[str] = None, response_format: Optional[Dict[str, str]] = None, stream: bool = config.LLM_STREAMING, until_keys: Optional[List[str]] = None, method: str = "generate_response") -> str:
+        """Generate a response using the OpenAI API, blocking until it is available.
+
+        Without `model`, the model of the method's route in the model routing table is used.
+        """
+        model = model or model_routing.get_route(self.name, method)["model"]
+        with tracer.span(f"{self.name}.{method}", "llm", agent=self.name, method=method, model=model):
+            return llm_client.run_sync(self.agenerate_response(recipient, user_message, system_message, model=model, response_format=response_format, stream=stream, until_keys=until_keys, method=method))
+
+    def generate_json(self, recipient: str, user_message: str, system_message: str, method: str, model: Optional[str] = None, until_keys: Optional[List[str]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Generate a JSON response and validate it against the schema of `method`.
+
+        Malformed responses are repaired locally where possible; only responses that cannot be
+        repaired are asked for again, up to config.SCHEMA_MAX_RETRIES times. If the method's route
+        has an escalation model, re-asks go to that model, and so does a response whose
+        "confidence" is below the route's minimum or missing. Returns the response text and the
+        validated data.
+        """
+        route = model_routing.get_route(self.name, method)
+        model = model or route["model"]
+        escalate_model = route["escalate_model"] if route["escalate_model"] != model else None
+        if until_keys and route["min_confidence"] is not None and "confidence" not in until_keys:
+            # Keep streaming until the confidence is known, or escalation could never trigger
+            until_keys = [*until_keys, "confidence"]
+        message = user_message
+        for attempt in range(config.SCHEMA_MAX_RETRIES + 1):
+            response = self.generate_response(recipient, message, system_message, model=model, response_format={"type": "json_object"}, until_keys=until_keys, method=method)
+            try:
+                data, repaired = response_schemas.parse_response(self.name, method, response, partial_keys=until_keys)
+            except response_schemas.SchemaError as e:
+                if attempt == config.SCHEMA_MAX_RETRIES:
+                    raise
+                logger.warning(f"{self.name}: Invalid {method} response ({str(e)}), asking again")
+                metrics.record_schema_result(self.name, method, repaired=False, retried=True, target=self.log_subdir)
+                if escalate_model:
+                    logger.info(f"{self.name}: Escalating {method} from {model} to {escalate_model}")
+                    metrics.record_escalation(self.name, method, target=self.log_subdir)
+                    model, escalate_model = escalate_model, None
+                message = f"{user_message}\n\nYour previous response could not be used: {str(e)}. Respond with a single valid JSON object with the keys {response_schemas.describe_schema(self.name, method)}."
+                continue
+            if repaired:
+                logger.info(f"{self.name}: Repaired {method} response locally")
+                metrics.record_schema_result(self.name, method, repaired=True, retried=False, target=self.log_subdir)
+            confidence = data.get("confidence")
+            if escalate_model and route["min_confidence"] is not None and (confidence is None or confidence < route["min_confidence"]):
+                logger.info(f"{self.name}: Low confidence ({confidence}) in {method} response, escalating from {model} to {escalate_model}")
+                metrics.record_escalation(self.name, method, target=self.log_subdir)
+                self.discard_last_exchange(recipient)
+                return self.generate_json(recipient, user_message, system_message, method, model=escalate_model, until_keys=until_keys)
+            return response, data
+
+    async def agenerate_response(self, recipient: str, user_message: str, system_message: str, model: Optional[str] = None, response_format: Optional[Dict[str, str]] = None, stream: bool = False, until_keys: Optional[List[str]] = None, method: str = "generate_response") -> str:
+        """Generate a response using the shared AsyncOpenAI client.
+
+        The model (unless given), max_tokens and temperature come from the method's route in the
+        model routing table. With `stream`, the response is rendered on the console as it arrives. For JSON responses,
+        `until_keys` stops the stream as soon as those top-level keys have been parsed; the
+        returned response then only contains the keys parsed so far.
+        """
+        route = model_routing.get_route(self.name, method)
+        model = model or route["model"]
+        options = route["options"]
+        # Concurrent calls share the counter, so keep this call's number for its log entry
         self.request_counter += 1
-        chat_history = self.get_chat_history(recipient)
+        request_number = self.request_counter
         self.add_to_chat_history(recipient, "user", user_message)
-        messages = chat_history.copy()
-        messages[0] = {"role": "system", "content": system_message}
+        messages = self.generate_chat_messages(recipient, system_message, model)
+        
+        cache = llm_cache.get_cache()
+        cache_key = llm_cache.ResponseCache.make_key(model, response_format, messages, options) if cache else None
+        start_time = time.monotonic()
+        call_info: Dict[str, Any] = {"retries": 0}
+        usage = None
+        usage_estimated = False
         
         try:
-            if response_format:
-                response = self.client.chat.completions.create(
-                    model=model,
-                    response_format=response_format,
-                    messages=messages
-                )
+            assistant_response = cache.get(cache_key) if cache else None
+            if assistant_response is not None:
+                logger.info(f"{self.name}: Using cached response")
+                call_info["cache_hit"] = True
             else:
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages
+                scheduler = rate_limiter.get_scheduler()
+                expected_completion_tokens = options.get("max_tokens", config.LLM_EXPECTED_COMPLETION_TOKENS)
+                estimated_tokens = context_window.count_message_tokens(messages, model) + expected_completion_tokens
+
+                async def request() -> Tuple[str, bool, Any]:
+                    async with llm_client.request_slot():
+                        if stream:
+                            return await self.stream_completion(model, messages, response_format, until_keys, options)
+                        kwargs: Dict[str, Any] = {"model": model, "messages": messages, **options}
+                        if response_format:
+                            kwargs["response_format"] = response_format
+                        response = await self.client.chat.completions.create(**kwargs)
+                        return response.choices[0].message.content, True, response.usage
+
+                assistant_response, complete, usage = await scheduler.call(
+                    request, estimated_tokens, rate_limiter.get_priority(self.name), description=self.name, info=call_info
                 )
-            assistant_response = response.choices[0].message.content
+                if usage is None:
+                    # Streams stopped early by until_keys report no usage; count the tokens locally
+                    usage = EstimatedUsage(
+                        context_window.count_message_tokens(messages, model),
+                        context_window.count_tokens(assistant_response or "", model)
+                    )
+                    usage_estimated = True
+                scheduler.record_usage(estimated_tokens, usage.total_tokens)
+                if cache and complete and assistant_response is not None:
+                    cache.put(cache_key, assistant_response)
             self.add_to_chat_history(recipient, "assistant", assistant_response)
-            self.log_response(messages, assistant_response)
+            self.log_response(messages, assistant_response, request_number)
+            metrics.record_llm_call(
+                self.name, method, model, time.monotonic() - start_time, usage=usage, retries=call_info["retries"],
+                response_cache_hit=call_info.get("cache_hit", False), usage_estimated=usage_estimated,
+                target=self.log_subdir
+            )
             return assistant_response
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
+            metrics.record_llm_call(self.name, method, model, time.monotonic() - start_time, retries=call_info["retries"], error=True, target=self.log_subdir)
             raise
 
-    def log_response(self, messages: List[Dict[str, str]], assistant_response: str) -> None:
-        """Log the response to a JSON file."""
-        log_dir = os.path.join(config.LOG_DIR, f"run{self.run_number}")
-        os.makedirs(log_dir, exist_ok=True)
-        log_file_path = os.path.join(log_dir, f"{self.name}.json")
+    async def stream_completion(self, model: str, messages: List[Dict[str, str]], response_format: Optional[Dict[str, str]], until_keys: Optional[List[str]], options: Optional[Dict[str, Any]] = None) -> Tuple[str, bool, Any]:
+        """Stream a completion to the console.
+
+        Returns its text, whether it was read to the end, and its token usage (None if the
+        stream was stopped early).
+        """
+        kwargs: Dict[str, Any] = {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}, **(options or {})}
+        if response_format:
+            kwargs["response_format"] = response_format
+        parser = IncrementalJSONParser() if response_format else None
+        color = self.get_output_color()
+        parts: List[str] = []
+        complete = True
+        usage = None
+
+        print(f"{color}{self.name}:{Style.RESET_ALL}")
+        response = await self.client.chat.completions.create(**kwargs)
+        try:
+            async for chunk in response:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if not token:
+                    continue
+                parts.append(token)
+                if parser is None:
+                    print(f"{color}{token}{Style.RESET_ALL}", end="", flush=True)
+                    continue
+                for key, value in parser.feed(token):
+                    self.print_agent_field(key, value)
+                if until_keys and parser.has_keys(until_keys):
+                    complete = False
+                    break
+        finally:
+            if not complete:
+                await response.close()
+        print("\n" if parser is None else "")
+
+        assistant_response = "".join(parts)
+        if not complete:
+            assistant_response = json.dumps(parser.values)
+        self.streamed_response = assistant_response
+        return assistant_response, complete, usage
+
+    def log_response(self, messages: List[Dict[str, str]], assistant_response: str, request_number: int) -> None:
+        """Append the response to the agent's JSONL run log."""
+        log_dir = os.path.join(config.LOG_DIR, f"run{self.run_number}", self.log_subdir)
+        log_file_path = os.path.join(log_dir, f"{self.name}{run_log.LOG_EXTENSION}")
+        blob_store = run_log.get_blob_store(log_dir)
 
-        Agent.global_order += 1
+        with Agent._order_lock:
+            Agent.global_order += 1
+            order = Agent.global_order
         log_entry = {
-            f"Request {self.request_counter}": {
-                "Order": Agent.global_order,
-                "Context": messages,
-                "Response": assistant_response
-            }
+            "Request": f"Request {request_number}",
+            "Order": order,
+            "ContextRefs": [blob_store.put(message) for message in messages],
+            "Response": assistant_response
         }
 
         try:
-            with open(log_file_path, "r+") as log_file:
-                existing_data = json.load(log_file)
-                existing_data.update(log_entry)
-                log_file.seek(0)
-                json.dump(existing_data, log_file, indent=2)
-                log_file.truncate()
-        except (FileNotFoundError, json.JSONDecodeError):
-            with open(log_file_path, "w") as log_file:
-                json.dump(log_entry, log_file, indent=2)
+            run_log.get_writer().write(log_file_path, log_entry)
         except Exception as e:
             logger.error(f"Error logging response: {str(e)}")
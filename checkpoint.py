@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+import logging
+from agent import Agent
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.json"
+PROGRESS_FILE = "progress.jsonl"
+JOBS_FILE = "jobs.json"
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Write JSON so that the file always holds either the old or the new content, even after a crash."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def apply_progress(progress: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """Apply one execution progress record to a progress dict.
+
+    A record either holds the result of a graph node ("node" and "result", None if the node was not run) or the
+    next command index of a sequential execution together with the output and executed commands
+    added since the previous record and the current rolling state.
+    """
+    if "node" in record:
+        progress.setdefault("nodes", {})[record["node"]] = record["result"]
+        return
+    progress["command_index"] = record["command_index"]
+    progress["output"] = progress.get("output", "") + record.get("output", "")
+    progress["executed_commands"] = progress.get("executed_commands", []) + record.get("executed_commands", [])
+    progress["rolling_state"] = record["rolling_state"]
+
+
+class Checkpoint:
+    """Durable orchestration state of one engagement.
+
+    The state and the agents' conversations are saved after every completed stage. Progress
+    within the execution stage is appended to a small journal next to the checkpoint, so saving
+    after every command does not rewrite the whole conversation state.
+    """
+
+    def __init__(self, path: str, state: Dict[str, Any]):
+        """Create a checkpoint backed by a file."""
+        self.path = path
+        self.progress_path = os.path.join(os.path.dirname(path), PROGRESS_FILE)
+        self.state = state
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        """Load a checkpoint, or return None if there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return cls(path, json.load(f))
+
+    def save(self, agents: Dict[str, Agent]) -> None:
+        """Save the state together with the agents' conversation state and start a new progress journal."""
+        with self._lock:
+            self.state["agents"] = {key: snapshot_agent(agent) for key, agent in agents.items()}
+            self.state["global_order"] = Agent.global_order
+            # Journal records are tagged with the save they follow, so a stale journal is never replayed
+            self.state["saves"] = self.state.get("saves", 0) + 1
+            write_json_atomic(self.path, self.state)
+            if os.path.exists(self.progress_path):
+                os.remove(self.progress_path)
+
+    def record_progress(self, record: Dict[str, Any]) -> None:
+        """Durably append an execution progress record (see apply_progress) to the journal."""
+        with self._lock:
+            with open(self.progress_path, "a") as f:
+                f.write(json.dumps({"save": self.state.get("saves", 0), **record}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load_progress(self) -> Dict[str, Any]:
+        """Replay the progress journal of the current stage into a progress dict."""
+        progress: Dict[str, Any] = {}
+        if not os.path.exists(self.progress_path):
+            return progress
+        with open(self.progress_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A record cut off by a crash; everything before it is intact
+                    logger.warning(f"Ignoring incomplete progress record in {self.progress_path}")
+                    break
+                if record.pop("save", None) == self.state.get("saves", 0):
+                    apply_progress(progress, record)
+        return progress
+
+    def restore_agents(self, agents: Dict[str, Agent]) -> None:
+        """Restore the agents' conversation state saved in the checkpoint."""
+        for key, snapshot in self.state.get("agents", {}).items():
+            if key in agents:
+                restore_agent(agents[key], snapshot)
+        Agent.global_order = max(Agent.global_order, self.state.get("global_order", 0))
+
+
+def snapshot_agent(agent: Agent) -> Dict[str, Any]:
+    """Capture the conversation state of an agent."""
+    return {
+        "chat_histories": agent.chat_histories,
+        "turn_summaries": {recipient: {str(index): summary for index, summary in summaries.items()} for recipient, summaries in agent.turn_summaries.items()},
+        "request_counter": agent.request_counter
+    }
+
+
+def restore_agent(agent: Agent, snapshot: Dict[str, Any]) -> None:
+    """Restore the conversation state of an agent from a snapshot."""
+    agent.chat_histories = snapshot.get("chat_histories", {})
+    agent.turn_summaries = {recipient: {int(index): summary for index, summary in summaries.items()} for recipient, summaries in snapshot.get("turn_summaries", {}).items()}
+    agent.request_counter = snapshot.get("request_counter", 0)
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+FORCE_PREFIX = "[force]"
+
+
+def normalize_command(command: str) -> str:
+    """Normalize a command line so that commands differing only in whitespace between words compare equal.
+
+    Quoting is kept as written, since quoted and unquoted operators or variables ("a;b" vs a;b)
+    behave differently in the shell; whitespace inside quotes is kept as well.
+    """
+    parts = []
+    quote = None
+    escaped = False
+    pending_space = False
+    for char in command.strip():
+        if quote is None and not escaped and char.isspace():
+            pending_space = True
+            continue
+        if pending_space:
+            parts.append(" ")
+            pending_space = False
+        parts.append(char)
+        if escaped:
+            escaped = False
+        elif char == "\\" and quote != "'":
+            escaped = True
+        elif quote is None and char in "'\"":
+            quote = char
+        elif char == quote:
+            quote = None
+    return "".join(parts)
+
+
+def split_force_marker(command: Any) -> Tuple[Any, bool]:
+    """Strip the force re-run marker from a strategy command.
+
+    A command is forced either by a "[force]" prefix on a string command or by a true "force" key
+    on an object command. Returns the command without the marker and whether it was forced.
+    """
+    if isinstance(command, dict):
+        return command, bool(command.get("force"))
+    if isinstance(command, str) and command.lstrip().lower().startswith(FORCE_PREFIX):
+        return command.lstrip()[len(FORCE_PREFIX):].lstrip(), True
+    return command, False
+
+
+class CommandResultCache:
+    """Per-run cache of command outputs and exit statuses, keyed by target and normalized command."""
+
+    def __init__(self, ttl: int):
+        """Create an empty cache whose entries expire after ttl seconds."""
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str], Tuple[float, str, int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, target: str, command: str) -> Optional[Tuple[str, int]]:
+        """Get the cached (output, exit status) of a command, or None if missing or expired."""
+        key = (target, normalize_command(command))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, target: str, command: str, output: str, exit_status: int) -> None:
+        """Store the result of a command."""
+        with self._lock:
+            self._entries[(target, normalize_command(command))] = (time.monotonic(), output, exit_status)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit and miss counts."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_cache: Optional[CommandResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[CommandResultCache]:
+    """Get the run's command result cache, or None if it is disabled."""
+    global _cache
+    if not config.COMMAND_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = CommandResultCache(config.COMMAND_CACHE_TTL)
+        return _cache
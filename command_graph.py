@@ -0,0 +1,106 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def has_dependencies(commands: List[Any]) -> bool:
+    """Check whether a strategy uses the dependency-aware command format."""
+    return any(isinstance(command, dict) for command in commands)
+
+
+def parse_commands(commands: List[Any]) -> List[Dict[str, Any]]:
+    """Normalize strategy commands into graph nodes.
+
+    Each command is either a plain string or an object with a 'command' key and optional 'id' and
+    'depends_on' keys. 'depends_on' lists ids of other commands, or their 1-based positions in the
+    strategy. Plain strings keep their sequential meaning: they become "sequential" nodes that
+    start only after the item before them and the previous plain string have finished (listed in
+    "after"), whether or not those succeeded. Raises ValueError on unknown dependencies or cycles.
+    """
+    nodes: List[Dict[str, Any]] = []
+    previous_sequential = None
+    for index, command in enumerate(commands):
+        if isinstance(command, dict):
+            if not command.get("command"):
+                raise ValueError(f"Strategy item {index + 1} has no 'command'")
+            node = dict(command)
+            node["id"] = str(command.get("id") or f"cmd{index + 1}")
+            depends_on = command.get("depends_on") or []
+            node["depends_on"] = [depends_on] if isinstance(depends_on, (str, int)) else list(depends_on)
+            node["after"] = []
+        else:
+            after = [nodes[-1]["id"]] if nodes else []
+            if previous_sequential and previous_sequential not in after:
+                after.append(previous_sequential)
+            node = {"id": f"cmd{index + 1}", "command": str(command), "depends_on": [], "after": after, "sequential": True}
+            previous_sequential = node["id"]
+        nodes.append(node)
+
+    ids = [node["id"] for node in nodes]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate command ids in strategy: {ids}")
+    for node in nodes:
+        resolved = []
+        for dependency in node["depends_on"]:
+            if isinstance(dependency, int) or (isinstance(dependency, str) and dependency.isdigit() and dependency not in ids):
+                position = int(dependency)
+                if not 1 <= position <= len(nodes):
+                    raise ValueError(f"Command '{node['id']}' depends on unknown position {dependency}")
+                dependency = nodes[position - 1]["id"]
+            elif dependency not in ids:
+                raise ValueError(f"Command '{node['id']}' depends on unknown command '{dependency}'")
+            if dependency != node["id"]:
+                resolved.append(dependency)
+        node["depends_on"] = resolved
+
+    _check_acyclic(nodes)
+    return nodes
+
+
+def _check_acyclic(nodes: List[Dict[str, Any]]) -> None:
+    remaining = {node["id"]: set(node["depends_on"]) | set(node["after"]) for node in nodes}
+    while remaining:
+        ready = [node_id for node_id, deps in remaining.items() if not deps & remaining.keys()]
+        if not ready:
+            raise ValueError(f"Dependency cycle between commands: {sorted(remaining)}")
+        for node_id in ready:
+            del remaining[node_id]
+
+
+def run_graph(nodes: List[Dict[str, Any]], run_node: Callable[[Dict[str, Any]], Any], max_workers: int) -> Dict[str, Dict[str, Any]]:
+    """Run graph nodes concurrently, starting each one once all of its dependencies have succeeded
+    and all of the nodes it runs after have finished.
+
+    Returns a mapping of node id to {"status": "done" | "failed" | "skipped", ...}. Nodes whose
+    dependencies failed or were skipped are skipped themselves.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    waiting = {node["id"]: node for node in nodes}
+    running: Dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="command") as executor:
+        while waiting or running:
+            for node_id, node in list(waiting.items()):
+                dependencies = node["depends_on"]
+                if any(results.get(dep, {}).get("status") in ("failed", "skipped") for dep in dependencies):
+                    results[node_id] = {"status": "skipped", "reason": "dependency did not complete"}
+                    del waiting[node_id]
+                elif all(results.get(dep, {}).get("status") == "done" for dep in dependencies) and all(dep in results for dep in node.get("after", [])):
+                    running[executor.submit(run_node, node)] = node_id
+                    del waiting[node_id]
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node_id = running.pop(future)
+                try:
+                    results[node_id] = {"status": "done", "result": future.result()}
+                except Exception as e:
+                    logger.error(f"Command '{node_id}' failed: {str(e)}")
+                    results[node_id] = {"status": "failed", "error": e}
+
+    return results
@@ -7,9 +7,72 @@ SSH_CONFIG = {
     'username': 'root',
     'password': 'kali',
 }
+SSH_WORKER_HOSTS = []
+SSH_KEEPALIVE_INTERVAL = 30
 
 OPENAI_MODEL = 'gpt-4o-mini-2024-07-18'
 LOG_DIR = 'context_logs'
 FINDINGS_FILE = 'findings.json'
 REPORT_FILE = 'findings_report.md'
+LLM_MAX_CONNECTIONS = 20
+LLM_MAX_KEEPALIVE_CONNECTIONS = 10
+LLM_REQUEST_TIMEOUT = 600
+LLM_CACHE_ENABLED = False
+LLM_CACHE_PATH = '.llm_cache/responses.sqlite3'
+LLM_CACHE_TTL = 604800
+LLM_CACHE_MAX_BYTES = 268435456
+CONTEXT_TOKEN_BUDGET_DEFAULT = 12000
+CONTEXT_TOKEN_BUDGETS = {
+    'Strategist': 16000,
+    'Manager': 24000,
+    'Debugger': 8000,
+    'Command_Monitor': 6000,
+    'Salah': 8000,
+    'Reporter': 48000,
+}
+CONTEXT_SUMMARY_TOKENS_PER_TURN = 120
+CONTEXT_SUMMARY_RESERVE = 0.2
+LOG_BATCH_SIZE = 64
+LOG_FLUSH_INTERVAL = 0.5
+LOG_BLOB_COMPRESSION_LEVEL = 6
+SSH_READ_CHUNK_SIZE = 65536
+SSH_SELECT_TIMEOUT = 0.2
+SSH_MAX_PARALLEL_COMMANDS = 4
+MONITOR_MODE = 'delta'
+MONITOR_STATE_MAX_COMMANDS = 10
+MONITOR_STATE_MAX_FACTS = 30
+MONITOR_FASTPATH_ENABLED = True
+MONITOR_FASTPATH_AUDIT_RATE = 0.05
+LLM_STREAMING = True
+SCAN_JOBS = []
+SCAN_MAX_CONCURRENT_JOBS = 4
+LLM_MAX_CONCURRENT_REQUESTS = 8
+SSH_MAX_SESSIONS = 8
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 200000
+LLM_EXPECTED_COMPLETION_TOKENS = 800
+LLM_MAX_RETRIES = 6
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 60.0
+LLM_PRIORITIES = {
+    'Command_Monitor': 0,
+    'Debugger': 0,
+    'Strategist': 1,
+    'Manager': 1,
+    'Reporter': 2,
+}
+TRACING_ENABLED = True
+REPORT_CHUNK_TOKENS = 6000
+REPORT_MAX_REVIEW_ROUNDS = 3
+TOOL_PARSERS_ENABLED = True
+NMAP_REQUEST_XML = True
+COMMAND_CACHE_ENABLED = True
+COMMAND_CACHE_TTL = 3600
+TERMINAL_NORMALIZE = True
+TERMINAL_KEEP_RAW = True
+COMMAND_TIMEOUT = 900
+COMMAND_TIMEOUT_GRACE = 5
+STRATEGY_TIMEOUT = 3600
+SCHEMA_MAX_RETRIES = 1
+MODEL_ROUTING_FILE = 'model_routing.json'
 API_KEY = os.getenv('OPENAI_API_KEY') or ''
@@ -0,0 +1,121 @@
+from typing import Dict, List, Optional
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encodings: Dict[str, object] = {}
+
+SUMMARY_HEADER = "Summary of earlier conversation (older turns condensed to stay within the context budget):"
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = config.OPENAI_MODEL) -> int:
+    """Count the tokens in a text, falling back to a character estimate when tiktoken is unavailable."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = config.OPENAI_MODEL) -> int:
+    """Count the tokens of a chat message list including per-message overhead."""
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_middle(text: str, max_tokens: int, model: str = config.OPENAI_MODEL) -> str:
+    """Shorten a text to roughly max_tokens by keeping its head and tail."""
+    tokens = count_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    keep_chars = max(int(len(text) * max_tokens / tokens) - 64, 0)
+    head = text[:keep_chars // 2]
+    tail = text[len(text) - keep_chars // 2:] if keep_chars // 2 else ""
+    return f"{head}\n... [{tokens - max_tokens} tokens omitted] ...\n{tail}"
+
+
+def summarize_turn(message: Dict[str, str], model: str = config.OPENAI_MODEL) -> str:
+    """Condense a single chat turn into a short summary line."""
+    content = " ".join((message.get("content") or "").split())
+    return f"{message['role']}: {truncate_middle(content, config.CONTEXT_SUMMARY_TOKENS_PER_TURN, model)}"
+
+
+def get_token_budget(agent_name: str) -> int:
+    """Get the prompt token budget for an agent."""
+    return config.CONTEXT_TOKEN_BUDGETS.get(agent_name, config.CONTEXT_TOKEN_BUDGET_DEFAULT)
+
+
+def build_context(system_message: str, history: List[Dict[str, str]], budget: int, summaries: Dict[int, str], model: str = config.OPENAI_MODEL) -> List[Dict[str, str]]:
+    """Build a prompt that fits the token budget.
+
+    `history` holds the conversation turns (without a system prompt), the last one being the
+    current request. The system message and the most recent turns are kept verbatim; older turns
+    are replaced by per-turn summaries, which are computed once and stored in `summaries` keyed
+    by their index in `history`.
+    """
+    system = {"role": "system", "content": system_message}
+    remaining = budget - count_message_tokens([system], model)
+    if not history:
+        return [system]
+
+    latest = dict(history[-1])
+    latest_tokens = count_message_tokens([latest], model)
+    if latest_tokens > remaining:
+        latest["content"] = truncate_middle(latest["content"] or "", max(remaining - MESSAGE_OVERHEAD_TOKENS, 0), model)
+        latest_tokens = count_message_tokens([latest], model)
+    remaining -= latest_tokens
+
+    older_tokens = count_message_tokens(history[:-1], model)
+    if older_tokens <= remaining:
+        return [system, *history[:-1], latest]
+
+    verbatim_budget = remaining - int(budget * config.CONTEXT_SUMMARY_RESERVE)
+    start = len(history) - 1
+    while start > 0:
+        turn_tokens = count_message_tokens([history[start - 1]], model)
+        if turn_tokens > verbatim_budget:
+            break
+        verbatim_budget -= turn_tokens
+        remaining -= turn_tokens
+        start -= 1
+
+    summary_message: Optional[Dict[str, str]] = None
+    if start > 0:
+        lines: List[str] = []
+        remaining -= count_tokens(SUMMARY_HEADER, model) + MESSAGE_OVERHEAD_TOKENS
+        for index in range(start - 1, -1, -1):
+            if index not in summaries:
+                summaries[index] = summarize_turn(history[index], model)
+            line_tokens = count_tokens(summaries[index], model) + 1
+            if line_tokens > remaining:
+                logger.debug(f"Dropping {index + 1} turns that do not fit in the summary")
+                break
+            remaining -= line_tokens
+            lines.append(summaries[index])
+        if lines:
+            summary_message = {"role": "system", "content": SUMMARY_HEADER + "\n" + "\n".join(reversed(lines))}
+
+    messages = [system]
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(history[start:-1])
+    messages.append(latest)
+    return messages
@@ -0,0 +1,115 @@
+import json
+from typing import Any, Dict, List
+import logging
+import config
+import context_window
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_repeated_lines(text: str) -> str:
+    """Collapse runs of identical consecutive lines into one line and a repeat count."""
+    lines = text.splitlines()
+    collapsed: List[str] = []
+    index = 0
+    while index < len(lines):
+        end = index + 1
+        while end < len(lines) and lines[end] == lines[index]:
+            end += 1
+        collapsed.append(lines[index])
+        if end - index > 1:
+            collapsed.append(f"[previous line repeated {end - index - 1} more times]")
+        index = end
+    return "\n".join(collapsed)
+
+
+def compact_findings(findings: List[Dict[str, Any]]) -> List[str]:
+    """Turn findings entries into compact JSON strings, one per entry.
+
+    Command outputs have repeated lines collapsed, and an output identical to an earlier one is
+    replaced by a reference to the entry that first contained it.
+    """
+    seen_outputs: Dict[str, int] = {}
+    compacted = []
+    for index, entry in enumerate(findings):
+        if isinstance(entry, dict) and isinstance(entry.get("output"), str):
+            entry = dict(entry)
+            output = collapse_repeated_lines(entry["output"])
+            if output in seen_outputs:
+                entry["output"] = f"[identical to the output of finding {seen_outputs[output]}]"
+            else:
+                seen_outputs[output] = index
+                entry["output"] = output
+        compacted.append(json.dumps({"finding": index, **entry} if isinstance(entry, dict) else entry, separators=(",", ":")))
+    return compacted
+
+
+def split_line(line: str, max_tokens: int) -> List[str]:
+    """Split a single line that is too long for a chunk into consecutive pieces of at most max_tokens."""
+    pieces: List[str] = []
+    while line:
+        line_tokens = context_window.count_tokens(line)
+        if line_tokens <= max_tokens:
+            pieces.append(line)
+            break
+        size = max(int(len(line) * max_tokens / line_tokens), 1)
+        while size > 1 and context_window.count_tokens(line[:size]) > max_tokens:
+            size = size * 9 // 10
+        pieces.append(line[:size])
+        line = line[size:]
+    return pieces
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Split a text on line boundaries into pieces of at most roughly max_tokens.
+
+    Lines longer than a piece are split across pieces, so no text is lost.
+    """
+    pieces: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        line_tokens = context_window.count_tokens(line)
+        if line_tokens > max_tokens:
+            if current:
+                pieces.append("".join(current))
+                current, current_tokens = [], 0
+            *full_pieces, line = split_line(line, max_tokens)
+            pieces.extend(full_pieces)
+            line_tokens = context_window.count_tokens(line)
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def chunk_findings(findings: List[Dict[str, Any]], max_tokens: int = config.REPORT_CHUNK_TOKENS) -> List[str]:
+    """Compact findings and pack them, in order, into chunks of at most roughly max_tokens.
+
+    A single entry larger than a chunk (usually a long command output) is split over several chunks.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for entry in compact_findings(findings):
+        entry_tokens = context_window.count_tokens(entry)
+        if entry_tokens > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            # Break the JSON string into lines so it can be split on line boundaries
+            chunks.extend(split_text(entry.replace("\\n", "\\n\n"), max_tokens))
+            continue
+        if current and current_tokens + entry_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(entry)
+        current_tokens += entry_tokens
+    if current:
+        chunks.append("\n".join(current))
+    logger.info(f"Split {len(findings)} findings into {len(chunks)} chunks")
+    return chunks
@@ -0,0 +1,68 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+
+class IncrementalJSONParser:
+    """Parse a streamed JSON object and report each top-level key as soon as its value is complete.
+
+    Text before the opening brace (such as a Markdown code fence) is ignored.
+    """
+
+    def __init__(self):
+        """Create a parser that has not seen any input yet."""
+        self.values: Dict[str, Any] = {}
+        self.complete = False
+        self._member: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of text and return the (key, value) pairs completed by it."""
+        completed: List[Tuple[str, Any]] = []
+        for char in chunk:
+            if self.complete:
+                break
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._finish_member())
+                    self.complete = True
+                    continue
+            elif char == "," and self._depth == 1:
+                completed.extend(self._finish_member())
+                continue
+            self._member.append(char)
+        return completed
+
+    def _finish_member(self) -> List[Tuple[str, Any]]:
+        member = "".join(self._member).strip()
+        self._member = []
+        if not member:
+            return []
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+        self.values.update(parsed)
+        return list(parsed.items())
+
+    def has_keys(self, keys: List[str]) -> bool:
+        """Check whether all the given top-level keys have been parsed."""
+        return all(key in self.values for key in keys)
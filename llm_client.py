@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, Dict, List, Optional, TypeVar
+import logging
+import httpx
+from openai import AsyncOpenAI
+import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_clients: Dict[str, AsyncOpenAI] = {}
+_request_semaphore: Optional[asyncio.Semaphore] = None
+_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get the process-wide event loop that runs all LLM requests, starting it if needed."""
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True)
+            _loop_thread.start()
+            logger.info("Started shared LLM event loop")
+        return _loop
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine on the shared event loop and block until it completes."""
+    loop = get_event_loop()
+    if _loop_thread is threading.current_thread():
+        raise RuntimeError("run_sync() cannot be called from the shared LLM event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def gather(*coros: Coroutine[Any, Any, Any]) -> List[Any]:
+    """Run independent coroutines concurrently on the shared event loop and return their results in order."""
+    async def _gather() -> List[Any]:
+        return list(await asyncio.gather(*coros))
+    return run_sync(_gather())
+
+
+def request_slot() -> asyncio.Semaphore:
+    """Get the semaphore bounding concurrent LLM requests across all agents and scan jobs.
+
+    Must be used from the shared event loop, e.g. `async with request_slot(): ...`.
+    """
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(config.LLM_MAX_CONCURRENT_REQUESTS)
+    return _request_semaphore
+
+
+def get_async_client(api_key: str) -> AsyncOpenAI:
+    """Get the shared AsyncOpenAI client for an API key.
+
+    All agents using the same key share one client and therefore one HTTP connection pool.
+    The client is bound to the shared event loop, so it must only be used from coroutines
+    running there (see run_sync).
+    """
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(config.LLM_REQUEST_TIMEOUT, connect=10.0),
+            )
+            # Retries are handled by rate_limiter so that they respect the shared rate limits
+            client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            _clients[api_key] = client
+        return client
+
+
+async def _close_clients() -> None:
+    for client in list(_clients.values()):
+        await client.close()
+    _clients.clear()
+
+
+def shutdown() -> None:
+    """Close the shared clients and stop the event loop."""
+    global _loop, _loop_thread, _request_semaphore
+    if _loop is None or _loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_clients(), _loop).result(timeout=5)
+    except Exception as e:
+        logger.error(f"Error closing LLM clients: {str(e)}")
+    _loop.call_soon_threadsafe(_loop.stop)
+    if _loop_thread is not None:
+        _loop_thread.join(timeout=5)
+    _loop.close()
+    _loop = None
+    _loop_thread = None
+    _request_semaphore = None
@@ -1,5 +1,9 @@
+import argparse
+import functools
 import json
-from typing import List, Dict, Any
+import os
+import signal
+from typing import List, Dict, Any, Callable, Optional
 from Agents.ammar import Strategist
 from Agents.hassan import Manager
 from Agents.kofahi import Debugger
@@ -7,7 +11,25 @@ from Agents.rakan import Command_Monitor
 from Agents.salah import Salah
 from Agents.sajed import Reporter
 from agent import Agent
+import command_cache
+from checkpoint import Checkpoint, CHECKPOINT_FILE, JOBS_FILE, write_json_atomic
 import config
+import llm_client
+import llm_cache
+import ssh_pool
+import output_classifier
+import report_sections
+import run_log
+import scheduler
+from metrics import metrics
+from tracing import tracer
+
+STAGE_GENERATE_STRATEGY = "generate_strategy"
+STAGE_REVIEW_STRATEGY = "review_strategy"
+STAGE_EXECUTE = "execute"
+STAGE_REVIEW_OUTPUT = "review_output"
+STAGE_REPORT = "report"
+STAGE_DONE = "done"
 
 def initialize_agents() -> Dict[str, Agent]:
     """Initialize all agent instances."""
@@ -20,46 +42,74 @@ def initialize_agents() -> Dict[str, Agent]:
         "reporter": Reporter(config.API_KEY)
     }
 
-def generate_and_review_strategy(agents: Dict[str, Agent], findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+def get_job_paths(job: Dict[str, Any]) -> Dict[str, str]:
+    """Get the log subdirectory and findings/report/checkpoint file paths of a scan job."""
+    run_dir = os.path.join(config.LOG_DIR, f"run{Agent.run_number}")
+    if not job.get("log_subdir"):
+        return {
+            "log_subdir": "",
+            "findings_file": config.FINDINGS_FILE,
+            "report_file": config.REPORT_FILE,
+            "checkpoint_file": os.path.join(run_dir, CHECKPOINT_FILE)
+        }
+    job_dir = os.path.join(run_dir, job["log_subdir"])
+    return {
+        "log_subdir": job["log_subdir"],
+        "findings_file": os.path.join(job_dir, config.FINDINGS_FILE),
+        "report_file": os.path.join(job_dir, config.REPORT_FILE),
+        "checkpoint_file": os.path.join(job_dir, CHECKPOINT_FILE)
+    }
+
+@tracer.traced()
+def generate_and_review_strategy(agents: Dict[str, Agent], job: Dict[str, Any], findings: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Generate and review the strategy."""
-    strategy = agents["strategist"].generate_strategy(config.TARGET_IP, config.SCAN_DESCRIPTION)
+    strategy = agents["strategist"].generate_strategy(job["target"], job["description"])
     findings.append({"strategy": strategy})
     print("Initial Strategy:")
     print(json.dumps(strategy, indent=2))
 
-    reviewed_strategy = agents["manager"].review_strategy(strategy, config.SCAN_DESCRIPTION)
+    reviewed_strategy = agents["manager"].review_strategy(strategy, job["description"])
     findings.append({"reviewed_strategy": reviewed_strategy})
     print("Manager's Review:")
     print(json.dumps(reviewed_strategy, indent=2))
 
     return reviewed_strategy
 
-def execute_commands(agents: Dict[str, Agent], commands: List[str], findings: List[Dict[str, Any]]) -> str:
+@tracer.traced()
+def execute_commands(agents: Dict[str, Agent], job: Dict[str, Any], commands: List[Any], findings: List[Dict[str, Any]], progress: Optional[Dict[str, Any]] = None, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
     """Execute commands and return the output."""
     output = agents["salah"].execute_commands(
-        commands, config.TARGET_IP, config.SCAN_DESCRIPTION,
-        agents["debugger"], agents["strategist"], agents["command_monitor"]
+        commands, job["target"], job["description"],
+        agents["debugger"], agents["strategist"], agents["command_monitor"],
+        progress=progress, on_progress=on_progress
     )
     print("Command Output:")
     print(output)
     findings.append({"commands": commands, "output": output})
     return output
 
-def review_output(agents: Dict[str, Agent], output: str, findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+@tracer.traced()
+def review_output(agents: Dict[str, Agent], job: Dict[str, Any], output: str, findings: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Review the command output."""
-    manager_assessment = agents["manager"].review_output(output, config.SCAN_DESCRIPTION)
+    manager_assessment = agents["manager"].review_output(output, job["description"])
     findings.append({"manager_assessment": manager_assessment})
     print("Manager's Thoughts on the scan result:")
     print(json.dumps(manager_assessment, indent=2))
     return manager_assessment
 
-def generate_and_review_report(agents: Dict[str, Agent], findings: List[Dict[str, Any]]) -> str:
-    """Generate and review the findings report."""
-    report = agents["reporter"].generate_report(config.TARGET_IP, config.SCAN_DESCRIPTION, config.FINDINGS_FILE)
+@tracer.traced()
+def generate_and_review_report(agents: Dict[str, Agent], job: Dict[str, Any], findings: List[Dict[str, Any]]) -> str:
+    """Generate and review the findings report.
+
+    Rejected reports are revised section by section when the Manager names the sections to change,
+    and regenerated in full otherwise. Reviews stop after config.REPORT_MAX_REVIEW_ROUNDS rounds.
+    """
+    findings_file = get_job_paths(job)["findings_file"]
+    report = agents["reporter"].generate_report(job["target"], job["description"], findings_file)
     print("Findings Report:")
     print(report)
 
-    while True:
+    for review_round in range(1, config.REPORT_MAX_REVIEW_ROUNDS + 1):
         manager_review = agents["manager"].review_report(report)
         findings.append({"manager_review": manager_review})
         print("Manager's Review:")
@@ -68,70 +118,210 @@ def generate_and_review_report(agents: Dict[str, Agent], findings: List[Dict[str
         if manager_review["Report Approval"]:
             print("Findings report has been approved by Manager.")
             break
+        if review_round == config.REPORT_MAX_REVIEW_ROUNDS:
+            print(f"Findings report was not approved after {review_round} review rounds; keeping the latest version.")
+            break
+
+        feedback = manager_review["feedback"]
+        print("Manager's feedback:")
+        print(feedback)
+        sections = report_sections.split_sections(report)
+        section_ids = []
+        for name in manager_review.get("sections") or []:
+            section = report_sections.find_section(sections, str(name))
+            if section is None:
+                print(f"Ignoring unknown report section named by Manager: {name}")
+            elif section["id"] not in section_ids:
+                section_ids.append(section["id"])
+
+        if section_ids:
+            print(f"Revising report sections: {', '.join(section_ids)}")
+            report = agents["reporter"].revise_sections(report, section_ids, feedback)
         else:
-            feedback = manager_review["feedback"]
-            print("Manager's feedback:")
-            print(feedback)
-            report = agents["reporter"].generate_report(config.TARGET_IP, config.SCAN_DESCRIPTION, config.FINDINGS_FILE, feedback=feedback)
-            print("Updated Findings Report:")
-            print(report)
+            report = agents["reporter"].generate_report(job["target"], job["description"], findings_file, feedback=feedback)
+        print("Updated Findings Report:")
+        print(report)
 
     return report
 
-def main():
-    Agent.increment_run_number()
-    current_run = Agent.run_number
-    print(f"Starting run {current_run}")
+@tracer.traced()
+def run_engagement(job: Dict[str, Any], resume: bool = False) -> Dict[str, Any]:
+    """Run the strategy, execute, review and report pipeline for one scan job.
 
+    The pipeline is a sequence of stages; the state is checkpointed after every stage, and
+    every executed command is journaled, so that an interrupted run can be resumed with --resume.
+    """
+    paths = get_job_paths(job)
     agents = initialize_agents()
-    findings: List[Dict[str, Any]] = []
+    for agent in agents.values():
+        agent.log_subdir = paths["log_subdir"]
 
-    strategy = agents["strategist"].generate_strategy(config.TARGET_IP, config.SCAN_DESCRIPTION)
-    findings.append({"initial_strategy": strategy})
-    print("Initial Strategy:")
-    print(json.dumps(strategy, indent=2))
+    checkpoint = Checkpoint.load(paths["checkpoint_file"]) if resume else None
+    if checkpoint:
+        checkpoint.restore_agents(agents)
+        print(f"Resuming engagement for {job['target']} at stage '{checkpoint.state['stage']}'")
+    else:
+        checkpoint = Checkpoint(paths["checkpoint_file"], {
+            "stage": STAGE_GENERATE_STRATEGY,
+            "findings": [],
+            "iterations": 0,
+            "review_rounds": 0,
+            "satisfactory": False
+        })
+    state = checkpoint.state
+    findings: List[Dict[str, Any]] = state["findings"]
 
-    while True:
-        reviewed_strategy = agents["manager"].review_strategy(strategy, config.SCAN_DESCRIPTION)
-        findings.append({"reviewed_strategy": reviewed_strategy})
-        print("Manager's Review:")
-        print(json.dumps(reviewed_strategy, indent=2))
-
-        if reviewed_strategy.get("approved", False):
-            commands = strategy.get("strategy", [])
-            if not commands:
-                print("Error: No commands found in the strategy. Skipping execution.")
-                break
-            
-            output = execute_commands(agents, commands, findings)
-            manager_assessment = review_output(agents, output, findings)
-
-            if manager_assessment.get("satisfactory", False):
-                print("Scan completed. Client's requirements have been met.")
-                break
-            else:
-                feedback = manager_assessment.get("feedback", "")
-                strategy = agents["strategist"].generate_strategy(config.TARGET_IP, config.SCAN_DESCRIPTION, feedback=feedback)
-                findings.append({"updated_strategy_based_on_output": strategy})
-                print("Updated strategy based on scan output:")
+    def advance(stage: str, **updates: Any) -> None:
+        state.update(updates)
+        state["stage"] = stage
+        checkpoint.save(agents)
+
+    while state["stage"] != STAGE_DONE:
+        stage = state["stage"]
+        with tracer.span(f"stage:{stage}", target=job["target"], round=state["review_rounds"]):
+            if stage == STAGE_GENERATE_STRATEGY:
+                strategy = agents["strategist"].generate_strategy(job["target"], job["description"])
+                findings.append({"initial_strategy": strategy})
+                print("Initial Strategy:")
                 print(json.dumps(strategy, indent=2))
+                advance(STAGE_REVIEW_STRATEGY, strategy=strategy)
+
+            elif stage == STAGE_REVIEW_STRATEGY:
+                strategy = state["strategy"]
+                reviewed_strategy = agents["manager"].review_strategy(strategy, job["description"])
+                findings.append({"reviewed_strategy": reviewed_strategy})
+                print("Manager's Review:")
+                print(json.dumps(reviewed_strategy, indent=2))
+
+                if reviewed_strategy.get("approved", False):
+                    if not strategy.get("strategy", []):
+                        print("Error: No commands found in the strategy. Skipping execution.")
+                        advance(STAGE_REPORT, review_rounds=state["review_rounds"] + 1)
+                    else:
+                        advance(STAGE_EXECUTE, review_rounds=state["review_rounds"] + 1)
+                else:
+                    feedback = reviewed_strategy.get("feedback", "")
+                    print("Manager's feedback:")
+                    print(feedback)
+                    strategy = agents["strategist"].generate_strategy(job["target"], job["description"], feedback=feedback)
+                    findings.append({"updated_strategy_based_on_review": strategy})
+                    print("Updated strategy based on Manager's feedback:")
+                    print(json.dumps(strategy, indent=2))
+                    advance(STAGE_REVIEW_STRATEGY, review_rounds=state["review_rounds"] + 1, strategy=strategy)
+
+            elif stage == STAGE_EXECUTE:
+                commands = state["strategy"].get("strategy", [])
+                progress = checkpoint.load_progress()
+                output = execute_commands(agents, job, commands, findings, progress=progress, on_progress=checkpoint.record_progress)
+                advance(STAGE_REVIEW_OUTPUT, iterations=state["iterations"] + 1, output=output)
+
+            elif stage == STAGE_REVIEW_OUTPUT:
+                manager_assessment = review_output(agents, job, state["output"], findings)
+                if manager_assessment.get("satisfactory", False):
+                    print("Scan completed. Client's requirements have been met.")
+                    advance(STAGE_REPORT, satisfactory=True)
+                else:
+                    feedback = manager_assessment.get("feedback", "")
+                    strategy = agents["strategist"].generate_strategy(job["target"], job["description"], feedback=feedback)
+                    findings.append({"updated_strategy_based_on_output": strategy})
+                    print("Updated strategy based on scan output:")
+                    print(json.dumps(strategy, indent=2))
+                    advance(STAGE_REVIEW_STRATEGY, strategy=strategy)
+
+            elif stage == STAGE_REPORT:
+                findings_dir = os.path.dirname(paths["findings_file"])
+                if findings_dir:
+                    os.makedirs(findings_dir, exist_ok=True)
+                with open(paths["findings_file"], "w") as f:
+                    json.dump(findings, f, indent=2)
+
+                report = generate_and_review_report(agents, job, findings)
+
+                with open(paths["report_file"], "w") as f:
+                    f.write(report)
+                print(f"Findings report saved as {paths['report_file']}")
+                advance(STAGE_DONE)
+
+            else:
+                raise ValueError(f"Unknown checkpoint stage: {stage}")
+
+    return {
+        "iterations": state["iterations"],
+        "satisfactory": state["satisfactory"],
+        "findings_file": paths["findings_file"],
+        "report_file": paths["report_file"]
+    }
+
+def load_jobs(jobs_file: Optional[str]) -> List[Dict[str, Any]]:
+    """Load scan jobs from a JSON file, config.SCAN_JOBS, or the single config.TARGET_IP."""
+    if jobs_file:
+        with open(jobs_file, "r") as f:
+            jobs = json.load(f)
+    else:
+        jobs = list(config.SCAN_JOBS)
+    if not jobs:
+        return [{"target": config.TARGET_IP, "description": config.SCAN_DESCRIPTION}]
+    return [{"target": job["target"], "description": job.get("description") or config.SCAN_DESCRIPTION} for job in jobs]
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Run automated vulnerability scan engagements.")
+    parser.add_argument("--jobs", help="JSON file with a list of {\"target\": ..., \"description\": ...} scan jobs")
+    parser.add_argument("--resume", metavar="RUN", help="resume an interrupted run (e.g. run3) from its checkpoints")
+    return parser.parse_args()
+
+def handle_sigterm(signum, frame):
+    """Flush pending run log entries and exit; the last checkpoint is already on disk."""
+    print("Received SIGTERM, flushing logs and exiting. Resume with --resume.")
+    run_log.get_writer().flush()
+    os._exit(128 + signum)
+
+def main():
+    args = parse_args()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    if args.resume:
+        Agent.run_number = int(args.resume.removeprefix("run"))
+        current_run = Agent.run_number
+        run_dir = os.path.join(config.LOG_DIR, f"run{current_run}")
+        with open(os.path.join(run_dir, JOBS_FILE), "r") as f:
+            jobs = json.load(f)
+        print(f"Resuming run {current_run}")
+    else:
+        Agent.increment_run_number()
+        current_run = Agent.run_number
+        run_dir = os.path.join(config.LOG_DIR, f"run{current_run}")
+        jobs = load_jobs(args.jobs)
+        if len(jobs) > 1:
+            jobs = scheduler.assign_log_subdirs(jobs)
+        write_json_atomic(os.path.join(run_dir, JOBS_FILE), jobs)
+        print(f"Starting run {current_run}")
+
+    engagement = functools.partial(run_engagement, resume=bool(args.resume))
+    with tracer.span("run", run=current_run, jobs=len(jobs)):
+        if len(jobs) == 1:
+            engagement(jobs[0])
         else:
-            feedback = reviewed_strategy.get("feedback", "")
-            print("Manager's feedback:")
-            print(feedback)
-            strategy = agents["strategist"].generate_strategy(config.TARGET_IP, config.SCAN_DESCRIPTION, feedback=feedback)
-            findings.append({"updated_strategy_based_on_review": strategy})
-            print("Updated strategy based on Manager's feedback:")
-            print(json.dumps(strategy, indent=2))
-
-    with open(config.FINDINGS_FILE, "w") as f:
-        json.dump(findings, f, indent=2)
-
-    report = generate_and_review_report(agents, findings)
-
-    with open(config.REPORT_FILE, "w") as f:
-        f.write(report)
-    print(f"Findings report saved as {config.REPORT_FILE}")
+            scheduler.run_jobs(jobs, engagement, config.SCAN_MAX_CONCURRENT_JOBS)
+
+    output_classifier.stats.save(os.path.join(run_dir, "classifier_stats.json"))
+    metrics.write(run_dir)
+    tracer.write(run_dir)
+    print(f"Run metrics saved to {os.path.join(run_dir, 'metrics.json')}")
+    for entry in metrics.summary()["agents"]:
+        print(f"{entry['agent']}: {entry['cached_token_rate']:.0%} of {entry['prompt_tokens']} prompt tokens served from the prompt cache")
+
+    result_cache = command_cache.get_cache()
+    if result_cache:
+        print(f"Command result cache stats: {json.dumps(result_cache.stats())}")
+
+    cache = llm_cache.get_cache()
+    if cache:
+        print(f"LLM cache stats: {json.dumps(cache.stats())}")
+        cache.close()
+
+    ssh_pool.get_pool().close_all()
+    llm_client.shutdown()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens: (input, cached input, output). Matched by model name prefix.
+MODEL_PRICING: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3-mini": (1.10, 0.55, 4.40),
+}
+
+METRICS_FILE = "metrics.json"
+PROMETHEUS_FILE = "metrics.prom"
+
+
+def get_pricing(model: str) -> Optional[Tuple[float, float, float]]:
+    """Get the per-million-token prices of a model, matching the longest known prefix."""
+    for prefix in sorted(MODEL_PRICING, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_PRICING[prefix]
+    return None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    """Estimate the cost of a call in USD (0 for models without known pricing)."""
+    pricing = get_pricing(model)
+    if pricing is None:
+        return 0.0
+    input_price, cached_price, output_price = pricing
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+class EstimatedUsage(NamedTuple):
+    """Locally counted token usage of a call whose API response did not report usage."""
+    prompt_tokens: int
+    completion_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def usage_tokens(usage: Any) -> Tuple[int, int, int]:
+    """Extract (prompt, completion, cached) token counts from an API usage object."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached
+
+
+def cached_token_rate(prompt_tokens: int, cached_tokens: int, estimated_prompt_tokens: int = 0) -> float:
+    """Get the share of prompt tokens served from the provider prompt cache.
+
+    Estimated prompt tokens are left out, since the cached tokens of those calls are unknown.
+    """
+    reported = prompt_tokens - estimated_prompt_tokens
+    return cached_tokens / reported if reported > 0 else 0.0
+
+
+def _new_llm_stats() -> Dict[str, Any]:
+    return {
+        "calls": 0, "errors": 0, "response_cache_hits": 0, "retries": 0, "schema_repairs": 0, "schema_retries": 0, "escalations": 0,
+        "wall_time_seconds": 0.0, "max_wall_time_seconds": 0.0, "estimated_usage_calls": 0, "estimated_prompt_tokens": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0
+    }
+
+
+class MetricsRegistry:
+    """Thread-safe collector of LLM call and SSH command metrics for a run."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._llm: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._commands: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record_llm_call(self, agent: str, method: str, model: str, wall_time: float, usage: Any = None, retries: int = 0, response_cache_hit: bool = False, error: bool = False, usage_estimated: bool = False, target: str = "") -> None:
+        """Record one call to Agent.generate_response.
+
+        With `usage_estimated`, `usage` was counted locally; its cost assumes no cached tokens.
+        """
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+        with self._lock:
+            stats = self._llm.setdefault((agent, method, target), _new_llm_stats())
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["response_cache_hits"] += int(response_cache_hit)
+            stats["retries"] += retries
+            stats["wall_time_seconds"] += wall_time
+            stats["max_wall_time_seconds"] = max(stats["max_wall_time_seconds"], wall_time)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cached_tokens"] += cached_tokens
+            if usage_estimated:
+                stats["estimated_usage_calls"] += 1
+                stats["estimated_prompt_tokens"] += prompt_tokens
+            stats["cost_usd"] += estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+
+    def record_schema_result(self, agent: str, method: str, repaired: bool, retried: bool, target: str = "") -> None:
+        """Record that a JSON response needed a local repair or a re-ask to match its schema."""
+        with self._lock:
+            stats = self._llm.setdefault((agent, method, target), _new_llm_stats())
+            stats["schema_repairs"] += int(repaired)
+            stats["schema_retries"] += int(retried)
+
+    def record_escalation(self, agent: str, method: str, target: str = "") -> None:
+        """Record that a call was repeated on a stronger model."""
+        with self._lock:
+            stats = self._llm.setdefault((agent, method, target), _new_llm_stats())
+            stats["escalations"] += 1
+
+    def record_command(self, agent: str, command: str, duration: float, output_bytes: int, exit_status: Optional[int], target: str = "") -> None:
+        """Record one SSH command execution."""
+        with self._lock:
+            self._commands.append({
+                "agent": agent,
+                "target": target,
+                "command": command,
+                "duration_seconds": round(duration, 3),
+                "output_bytes": output_bytes,
+                "exit_status": exit_status
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        """Return all metrics with per-call averages and run totals."""
+        with self._lock:
+            llm_calls = []
+            for (agent, method, target), stats in sorted(self._llm.items()):
+                entry = {"agent": agent, "method": method, "target": target, **stats}
+                entry["avg_wall_time_seconds"] = stats["wall_time_seconds"] / stats["calls"] if stats["calls"] else 0.0
+                llm_calls.append(entry)
+            commands = list(self._commands)
+
+        agents: Dict[str, Dict[str, Any]] = {}
+        for entry in llm_calls:
+            stats = agents.setdefault(entry["agent"], {"agent": entry["agent"], "calls": 0, "estimated_usage_calls": 0, "prompt_tokens": 0, "estimated_prompt_tokens": 0, "cached_tokens": 0})
+            for key in ("calls", "estimated_usage_calls", "prompt_tokens", "estimated_prompt_tokens", "cached_tokens"):
+                stats[key] += entry[key]
+        for stats in agents.values():
+            stats["cached_token_rate"] = cached_token_rate(stats["prompt_tokens"], stats["cached_tokens"], stats["estimated_prompt_tokens"])
+
+        totals = {
+            "llm_calls": sum(entry["calls"] for entry in llm_calls),
+            "llm_wall_time_seconds": sum(entry["wall_time_seconds"] for entry in llm_calls),
+            "prompt_tokens": sum(entry["prompt_tokens"] for entry in llm_calls),
+            "completion_tokens": sum(entry["completion_tokens"] for entry in llm_calls),
+            "cached_tokens": sum(entry["cached_tokens"] for entry in llm_calls),
+            "cached_token_rate": cached_token_rate(
+                sum(entry["prompt_tokens"] for entry in llm_calls),
+                sum(entry["cached_tokens"] for entry in llm_calls),
+                sum(entry["estimated_prompt_tokens"] for entry in llm_calls)
+            ),
+            "estimated_usage_calls": sum(entry["estimated_usage_calls"] for entry in llm_calls),
+            "retries": sum(entry["retries"] for entry in llm_calls),
+            "schema_repairs": sum(entry["schema_repairs"] for entry in llm_calls),
+            "schema_retries": sum(entry["schema_retries"] for entry in llm_calls),
+            "escalations": sum(entry["escalations"] for entry in llm_calls),
+            "cost_usd": sum(entry["cost_usd"] for entry in llm_calls),
+            "commands": len(commands),
+            "command_time_seconds": sum(command["duration_seconds"] for command in commands),
+            "command_output_bytes": sum(command["output_bytes"] for command in commands)
+        }
+        return {"totals": totals, "agents": [agents[agent] for agent in sorted(agents)], "llm_calls": llm_calls, "commands": commands}
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        summary = self.summary()
+        series = [
+            ("gp_llm_calls_total", "counter", "LLM calls", "calls"),
+            ("gp_llm_errors_total", "counter", "Failed LLM calls", "errors"),
+            ("gp_llm_response_cache_hits_total", "counter", "LLM calls answered from the response cache", "response_cache_hits"),
+            ("gp_llm_retries_total", "counter", "Retried LLM requests", "retries"),
+            ("gp_llm_schema_repairs_total", "counter", "JSON responses repaired locally to match their schema", "schema_repairs"),
+            ("gp_llm_schema_retries_total", "counter", "Re-asks for JSON responses that could not be repaired", "schema_retries"),
+            ("gp_llm_escalations_total", "counter", "Calls repeated on a stronger model after a schema failure or low confidence", "escalations"),
+            ("gp_llm_estimated_usage_calls_total", "counter", "LLM calls whose token usage was counted locally because the API reported none", "estimated_usage_calls"),
+            ("gp_llm_wall_time_seconds_total", "counter", "Wall time spent in LLM calls", "wall_time_seconds"),
+            ("gp_llm_prompt_tokens_total", "counter", "Prompt tokens", "prompt_tokens"),
+            ("gp_llm_completion_tokens_total", "counter", "Completion tokens", "completion_tokens"),
+            ("gp_llm_cached_tokens_total", "counter", "Prompt tokens served from the provider prompt cache", "cached_tokens"),
+            ("gp_llm_cost_usd_total", "counter", "Estimated LLM cost in USD", "cost_usd"),
+        ]
+        lines: List[str] = []
+        for name, metric_type, help_text, key in series:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for entry in summary["llm_calls"]:
+                labels = f'agent="{entry["agent"]}",method="{entry["method"]}",target="{entry["target"]}"'
+                lines.append(f"{name}{{{labels}}} {entry[key]}")
+
+        lines.append("# HELP gp_llm_cached_token_ratio Share of prompt tokens served from the provider prompt cache")
+        lines.append("# TYPE gp_llm_cached_token_ratio gauge")
+        for entry in summary["agents"]:
+            lines.append(f'gp_llm_cached_token_ratio{{agent="{entry["agent"]}"}} {entry["cached_token_rate"]}')
+
+        per_agent: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for command in summary["commands"]:
+            stats = per_agent.setdefault((command["agent"], command["target"]), {"count": 0, "seconds": 0.0, "bytes": 0})
+            stats["count"] += 1
+            stats["seconds"] += command["duration_seconds"]
+            stats["bytes"] += command["output_bytes"]
+        for name, help_text, key in [
+            ("gp_ssh_commands_total", "Executed SSH commands", "count"),
+            ("gp_ssh_command_seconds_total", "Wall time spent in SSH commands", "seconds"),
+            ("gp_ssh_command_output_bytes_total", "Bytes of SSH command output", "bytes"),
+        ]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (agent, target), stats in sorted(per_agent.items()):
+                lines.append(f'{name}{{agent="{agent}",target="{target}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, run_dir: str) -> None:
+        """Write metrics.json and metrics.prom to a run directory."""
+        os.makedirs(run_dir, exist_ok=True)
+        try:
+            with open(os.path.join(run_dir, METRICS_FILE), "w") as f:
+                json.dump(self.summary(), f, indent=2)
+            with open(os.path.join(run_dir, PROMETHEUS_FILE), "w") as f:
+                f.write(self.to_prometheus())
+        except Exception as e:
+            logger.error(f"Error writing metrics: {str(e)}")
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+_routing: Optional[Dict[str, Any]] = None
+_routing_lock = threading.Lock()
+
+
+def load_routing(path: str = config.MODEL_ROUTING_FILE) -> Dict[str, Any]:
+    """Load the routing table, falling back to config.OPENAI_MODEL for everything if the file is missing."""
+    global _routing
+    with _routing_lock:
+        if _routing is None:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    _routing = json.load(f)
+            else:
+                logger.warning(f"Model routing file {path} not found, using {config.OPENAI_MODEL} for all agents")
+                _routing = {}
+        return _routing
+
+
+def get_tier_model(tier: Optional[str]) -> Optional[str]:
+    """Get the model of a tier; an empty tier model stands for config.OPENAI_MODEL."""
+    if not tier:
+        return None
+    tiers = load_routing().get("tiers", {})
+    if tier not in tiers:
+        logger.warning(f"Unknown model tier: {tier}")
+        return None
+    return tiers[tier] or config.OPENAI_MODEL
+
+
+def get_route(agent: str, method: str) -> Dict[str, Any]:
+    """Get the model, generation options and escalation policy for an agent method.
+
+    The result has "model", "options" (max_tokens/temperature to pass to the API), and
+    "escalate_model" and "min_confidence" (both None if the route does not escalate).
+    """
+    routing = load_routing()
+    route = {**routing.get("default", {}), **routing.get("routes", {}).get(f"{agent}.{method}", {})}
+    model = route.get("model") or get_tier_model(route.get("tier")) or config.OPENAI_MODEL
+    escalate_model = get_tier_model(route.get("escalate_to"))
+    return {
+        "model": model,
+        "options": {key: route[key] for key in ("max_tokens", "temperature") if route.get(key) is not None},
+        "escalate_model": escalate_model if escalate_model != model else None,
+        "min_confidence": route.get("min_confidence")
+    }
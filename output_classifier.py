@@ -0,0 +1,97 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRAILER_CHARS = 200
+
+PROMPT_TRAILER_PATTERNS = [
+    re.compile(r"(password|passphrase|passcode|pin)( for [^:]*)?\s*:\s*$", re.IGNORECASE),
+    re.compile(r"(login|username|user name|user)\s*:\s*$", re.IGNORECASE),
+    re.compile(r"[\[(]\s*y(es)?\s*/\s*n(o)?\s*[\])]\s*[:?]?\s*$", re.IGNORECASE),
+    re.compile(r"\b(continue|proceed|overwrite|are you sure)\b.*\?\s*$", re.IGNORECASE),
+    re.compile(r"\b(enter|type|choose|select|press)\b.*[:?>]\s*$", re.IGNORECASE),
+    re.compile(r"(msf\d*|meterpreter)( [^>]*)?\s*>\s*$", re.IGNORECASE),
+    re.compile(r"(smb: \\.*|ftp|sftp|mysql|sql|postgres=#|rpcclient \$|telnet|>>>)\s*>?\s*$", re.IGNORECASE),
+    re.compile(r"^(\S+@\S+\s*)?[$#]\s*$"),
+]
+
+
+def is_prompt_trailer(output: str) -> bool:
+    """Check whether the end of the output looks like a prompt waiting for input."""
+    tail = output[-TRAILER_CHARS:].rstrip("\r\n")
+    last_line = tail.splitlines()[-1] if tail.splitlines() else ""
+    return any(pattern.search(last_line) for pattern in PROMPT_TRAILER_PATTERNS)
+
+
+def classify_output(command_output: str, exit_status: Optional[int]) -> Dict[str, Any]:
+    """Classify command output locally.
+
+    Returns the Command_Monitor verdict plus a 'confident' flag. Only confident verdicts may skip
+    the model: the command has exited and the output does not end in a prompt-like trailer.
+    """
+    if exit_status is None:
+        return {"input_needed": False, "confident": False, "reason": "Command is still running."}
+    if is_prompt_trailer(command_output):
+        return {"input_needed": True, "confident": False, "reason": "Output ends with a prompt-like trailer."}
+    return {"input_needed": False, "confident": True, "reason": f"Command exited with status {exit_status} and is not waiting for input."}
+
+
+class ClassifierStats:
+    """Counters of fast-path decisions and of agreement between the classifier and the model."""
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.fast_path = 0
+        self.model_calls = 0
+        self.audits = 0
+        self.agreements = 0
+        self.disagreements = 0
+        self._lock = threading.Lock()
+
+    def record_fast_path(self) -> None:
+        """Record a verdict returned without calling the model."""
+        with self._lock:
+            self.fast_path += 1
+
+    def record_model_call(self, local_verdict: Dict[str, Any], model_verdict: Dict[str, Any], audit: bool = False) -> None:
+        """Record a model call and whether the model agreed with the local verdict."""
+        with self._lock:
+            self.model_calls += 1
+            if audit:
+                self.audits += 1
+            if bool(local_verdict.get("input_needed")) == bool(model_verdict.get("input_needed")):
+                self.agreements += 1
+            else:
+                self.disagreements += 1
+                logger.info(f"Output classifier disagreed with the model: local={local_verdict.get('input_needed')} model={model_verdict.get('input_needed')} ({local_verdict.get('reason')})")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the counters and derived rates."""
+        with self._lock:
+            compared = self.agreements + self.disagreements
+            total = self.fast_path + self.model_calls
+            return {
+                "fast_path": self.fast_path,
+                "model_calls": self.model_calls,
+                "audits": self.audits,
+                "agreements": self.agreements,
+                "disagreements": self.disagreements,
+                "fast_path_rate": self.fast_path / total if total else 0.0,
+                "agreement_rate": self.agreements / compared if compared else 0.0
+            }
+
+    def save(self, path: str) -> None:
+        """Write the counters to a JSON file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+stats = ClassifierStats()
@@ -0,0 +1,45 @@
+import json
+from typing import Dict, List, Optional, Tuple
+import logging
+import response_schemas
+
+logger = logging.getLogger(__name__)
+
+with open('system_messages.json', 'r') as f:
+    system_messages = json.load(f)
+
+TASKS_PREAMBLE = "Each request starts with a 'Task:' line naming one of the tasks below, followed by the data for that request. Follow the instructions of that task only."
+
+_system_prompts: Dict[str, str] = {}
+
+
+def system_prompt(agent: str) -> str:
+    """Get the static system prompt of an agent.
+
+    The prompt holds the instructions and response keys of all of the agent's tasks, so it is
+    byte-identical for every call of the agent and the provider can cache it as a shared prefix
+    even when the agent switches between tasks in the same conversation.
+    """
+    if agent not in _system_prompts:
+        parts = [TASKS_PREAMBLE]
+        for method, instructions in system_messages[agent].items():
+            section = f"### Task: {method}\n{instructions}"
+            keys = response_schemas.describe_schema(agent, method)
+            if keys:
+                section += f"\nResponse keys: {keys}"
+            parts.append(section)
+        _system_prompts[agent] = "\n\n".join(parts)
+    return _system_prompts[agent]
+
+
+def user_prompt(method: str, sections: List[Tuple[str, Optional[str]]]) -> str:
+    """Build the per-call message of a task from labelled data sections.
+
+    Sections without a value are left out; multi-line values start on their own line.
+    """
+    lines = [f"Task: {method}"]
+    for label, value in sections:
+        if value is None:
+            continue
+        lines.append(f"{label}:\n{value}" if "\n" in value else f"{label}: {value}")
+    return "\n".join(lines)
@@ -0,0 +1,180 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import logging
+import openai
+import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+
+
+class TokenBucket:
+    """Bucket refilled continuously at a per-minute rate, holding at most one minute of capacity."""
+
+    def __init__(self, per_minute: int):
+        """Create a full bucket."""
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be consumed (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Take `amount` from the bucket; a negative amount returns capacity."""
+        self._refill()
+        self.available = min(self.capacity, self.available - min(amount, self.capacity))
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After delay from an API error's response headers, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether an API error is worth retrying."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class RequestScheduler:
+    """Admits LLM requests within requests-per-minute and tokens-per-minute limits, by priority.
+
+    Lower priority values are served first; requests of equal priority are served in arrival
+    order. Rate-limit errors pause all requests until the server's Retry-After has elapsed.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_retries: int, backoff_base: float, backoff_max: float):
+        """Create a scheduler with the given limits and retry policy."""
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.paused_until = 0.0
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, estimated_tokens: int, priority: int) -> None:
+        """Wait until the request is first in line and both buckets have room for it."""
+        entry = (priority, next(self._sequence))
+        async with self._condition:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] == entry:
+                        wait = max(
+                            self.paused_until - time.monotonic(),
+                            self.requests.wait_time(1),
+                            self.tokens.wait_time(estimated_tokens)
+                        )
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(estimated_tokens)
+                            return
+                        try:
+                            await asyncio.wait_for(self._condition.wait(), timeout=wait)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._condition.wait()
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket once the real token count of a request is known."""
+        self.tokens.consume(actual_tokens - estimated_tokens)
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Compute a jittered exponential backoff delay that is never shorter than Retry-After."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def call(self, request: Callable[[], Awaitable[T]], estimated_tokens: int, priority: int = PRIORITY_DEFAULT, description: str = "", info: Optional[Dict[str, Any]] = None) -> T:
+        """Run a request under the rate limits, retrying retryable errors with backoff.
+
+        If `info` is given, its "retries" key is set to the number of retries made.
+        """
+        attempt = 0
+        if info is not None:
+            info["retries"] = 0
+        while True:
+            await self.acquire(estimated_tokens, priority)
+            try:
+                return await request()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logger.warning(f"{description}: {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                attempt += 1
+                if info is not None:
+                    info["retries"] = attempt
+                await asyncio.sleep(delay)
+
+
+_scheduler: Optional[RequestScheduler] = None
+
+
+def get_scheduler() -> RequestScheduler:
+    """Get the scheduler shared by all agents; must be called from the shared LLM event loop."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler(
+            config.LLM_REQUESTS_PER_MINUTE,
+            config.LLM_TOKENS_PER_MINUTE,
+            config.LLM_MAX_RETRIES,
+            config.LLM_BACKOFF_BASE,
+            config.LLM_BACKOFF_MAX
+        )
+    return _scheduler
+
+
+def get_priority(agent_name: str) -> int:
+    """Get the scheduling priority of an agent (lower runs first)."""
+    return config.LLM_PRIORITIES.get(agent_name, PRIORITY_DEFAULT)
@@ -0,0 +1,78 @@
+import re
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+SECTION_HEADING = re.compile(r"^(#{1,2})\s+(.+?)\s*#*\s*$")
+PREAMBLE_ID = "preamble"
+
+
+def slugify(title: str) -> str:
+    """Turn a section title into a stable section id."""
+    slug = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+    return slug or "section"
+
+
+def split_sections(report: str) -> List[Dict[str, str]]:
+    """Split a Markdown report into sections at level 1 and 2 headings.
+
+    Each section is a dict with "id", "title" and "text" (the heading line and body). Text before
+    the first heading becomes a "preamble" section. Headings inside code fences are ignored.
+    """
+    sections: List[Dict[str, str]] = []
+    current: Dict[str, str] = {"id": PREAMBLE_ID, "title": "", "text": ""}
+    seen: Dict[str, int] = {}
+    in_fence = False
+    for line in report.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else SECTION_HEADING.match(line.rstrip("\r\n"))
+        if match:
+            if current["text"].strip():
+                sections.append(current)
+            title = match.group(2)
+            section_id = slugify(title)
+            seen[section_id] = seen.get(section_id, 0) + 1
+            if seen[section_id] > 1:
+                section_id = f"{section_id}-{seen[section_id]}"
+            current = {"id": section_id, "title": title, "text": ""}
+        current["text"] += line
+    if current["text"].strip():
+        sections.append(current)
+    return sections
+
+
+def join_sections(sections: List[Dict[str, str]]) -> str:
+    """Reassemble a report from its sections."""
+    parts = []
+    for section in sections:
+        text = section["text"]
+        parts.append(text if text.endswith("\n") else text + "\n")
+    return "".join(parts).strip()
+
+
+def render_outline(sections: List[Dict[str, str]]) -> str:
+    """List the section ids and titles of a report for a prompt."""
+    return "\n".join(f"- {section['id']}: {section['title'] or '(text before the first heading)'}" for section in sections)
+
+
+def find_section(sections: List[Dict[str, str]], name: str) -> Optional[Dict[str, str]]:
+    """Find a section by id or, failing that, by its title (case-insensitive)."""
+    name = name.strip()
+    for section in sections:
+        if section["id"] == name:
+            return section
+    for section in sections:
+        if section["title"].lower() == name.lower() or section["id"] == slugify(name):
+            return section
+    return None
+
+
+def replace_sections(sections: List[Dict[str, str]], revised: Dict[str, str]) -> List[Dict[str, str]]:
+    """Return the sections with the text of the given section ids replaced; unknown ids are ignored."""
+    known = {section["id"] for section in sections}
+    for section_id in revised:
+        if section_id not in known:
+            logger.warning(f"Ignoring revision of unknown report section: {section_id}")
+    return [{**section, "text": revised[section["id"]]} if section["id"] in revised else section for section in sections]
@@ -0,0 +1,247 @@
+import copy
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaError(ValueError):
+    """Raised when a response cannot be parsed or repaired to match its schema."""
+
+
+def field(field_type: type, default: Any = None, required: bool = False, aliases: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Describe one top-level key of a JSON response."""
+    return {"type": field_type, "default": default, "required": required, "aliases": aliases or []}
+
+
+# Expected top-level keys of the JSON responses of each "Agent.method"
+SCHEMAS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "Strategist.generate_strategy": {
+        "strategy": field(list, required=True, aliases=["commands", "strategies", "plan"]),
+        "description": field(str, "", aliases=["explanation", "reasoning"]),
+    },
+    "Strategist.generate_input": {
+        "input": field(str, "", aliases=["command", "next_command", "input_command"]),
+        "confidence": field(float, None, aliases=["certainty", "confidence_score"]),
+    },
+    "Manager.review_strategy": {
+        "approved": field(bool, False, aliases=["approval", "strategy_approved", "is_approved"]),
+        "feedback": field(str, "", aliases=["comments", "suggestions", "review"]),
+    },
+    "Manager.review_output": {
+        "satisfactory": field(bool, False, aliases=["is_satisfactory", "approved", "complete"]),
+        "feedback": field(str, "", aliases=["comments", "suggestions", "next_steps"]),
+    },
+    "Manager.review_report": {
+        "Report Approval": field(bool, False, aliases=["approved", "approval", "report_approved"]),
+        "feedback": field(str, "", aliases=["comments", "suggestions"]),
+        "sections": field(list, [], aliases=["sections_to_revise", "section_ids", "revise_sections"]),
+    },
+    "Debugger.handle_error": {
+        "fix": field(list, [], aliases=["fixes", "commands", "fix_commands"]),
+        "explanation": field(str, "", aliases=["reason", "description"]),
+    },
+    "Command_Monitor.monitor_output": {
+        "input_needed": field(bool, required=True, aliases=["needs_input", "input_required", "requires_input", "waiting_for_input"]),
+        "reason": field(str, "", aliases=["explanation", "analysis"]),
+        "confidence": field(float, None, aliases=["certainty", "confidence_score"]),
+    },
+    "Reporter.revise_sections": {
+        "sections": field(dict, required=True, aliases=["revised_sections", "revisions"]),
+    },
+}
+
+CODE_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+TRUE_STRINGS = {"true", "yes", "y", "1"}
+FALSE_STRINGS = {"false", "no", "n", "0", "", "none", "null"}
+
+
+def _key_id(key: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", key.lower())
+
+
+def _replace_outside_strings(text: str, replacements: Dict[str, str]) -> str:
+    """Replace bare words (e.g. Python's True/False/None) that are not inside JSON strings."""
+    pattern = re.compile(r'"(?:\\.|[^"\\])*"|\b(' + "|".join(replacements) + r')\b')
+    return pattern.sub(lambda match: replacements[match.group(1)] if match.group(1) else match.group(0), text)
+
+
+def _closers(text: str) -> Optional[str]:
+    """Get the characters that close the strings, objects and arrays left open in a truncated document."""
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+    return ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def close_truncated(text: str) -> Optional[Any]:
+    """Parse a document that was cut off, dropping the incomplete last member if needed.
+
+    A value cut off in the middle of a string is always dropped, so that e.g. half a command
+    never ends up in a strategy.
+    """
+    candidates = [text]
+    position = len(text)
+    for _ in range(20):
+        position = text.rfind(",", 0, position)
+        if position == -1:
+            break
+        candidates.append(text[:position])
+    for candidate in candidates:
+        closers = _closers(candidate)
+        if closers is None or closers.startswith('"'):
+            continue
+        try:
+            return json.loads(TRAILING_COMMA.sub(r"\1", candidate.rstrip() + closers))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def load_lenient(text: str) -> Tuple[Any, bool]:
+    """Parse JSON, repairing common defects if needed.
+
+    Strips code fences and surrounding prose, removes trailing commas, converts Python literals and
+    closes truncated documents. Returns the data and whether a repair was needed.
+    """
+    try:
+        return json.loads(text), False
+    except (json.JSONDecodeError, TypeError):
+        pass
+    if not isinstance(text, str):
+        raise SchemaError("Response is empty")
+
+    cleaned = text.strip()
+    fenced = CODE_FENCE.match(cleaned)
+    if fenced:
+        cleaned = fenced.group(1).strip()
+    start = cleaned.find("{")
+    if start == -1:
+        raise SchemaError("Response contains no JSON object")
+    end = cleaned.rfind("}")
+    body = cleaned[start:end + 1] if end > start else cleaned[start:]
+    body = _replace_outside_strings(body, {"True": "true", "False": "false", "None": "null"})
+    body = TRAILING_COMMA.sub(r"\1", body)
+    try:
+        return json.loads(body), True
+    except json.JSONDecodeError:
+        pass
+    data = close_truncated(cleaned[start:])
+    if data is None:
+        raise SchemaError("Response is not valid JSON and could not be repaired")
+    return data, True
+
+
+def coerce(value: Any, spec: Dict[str, Any], key: str) -> Any:
+    """Convert a value to the type a schema field expects."""
+    field_type = spec["type"]
+    if value is None:
+        if spec["required"]:
+            raise SchemaError(f"Key '{key}' is null")
+        return copy.deepcopy(spec["default"])
+    if isinstance(value, field_type) and not (field_type is int and isinstance(value, bool)):
+        return value
+    if field_type is bool:
+        if isinstance(value, (int, float)):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in TRUE_STRINGS | FALSE_STRINGS:
+            return value.strip().lower() in TRUE_STRINGS
+    elif field_type is list:
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        if isinstance(value, dict):
+            return list(value.values())
+    elif field_type is str:
+        return value if isinstance(value, str) else json.dumps(value)
+    elif field_type is float:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value.strip().rstrip("%")) / (100 if value.strip().endswith("%") else 1)
+            except ValueError:
+                pass
+    raise SchemaError(f"Key '{key}' should be of type {field_type.__name__}, got {type(value).__name__}")
+
+
+def validate(data: Any, schema: Dict[str, Dict[str, Any]], partial_keys: Optional[List[str]] = None) -> Tuple[Dict[str, Any], bool]:
+    """Normalize key names and types of a response and fill in defaults.
+
+    `partial_keys` are the keys a streamed response was deliberately cut off after; if all of them
+    are present, filling in the keys that were not streamed does not count as a change. Returns
+    the normalized data and whether anything had to be changed.
+    """
+    if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
+        data = data[0]
+    if not isinstance(data, dict):
+        raise SchemaError(f"Response should be a JSON object, got {type(data).__name__}")
+
+    lookup = {}
+    for key, spec in schema.items():
+        for name in [key, *spec["aliases"]]:
+            lookup.setdefault(_key_id(name), key)
+
+    normalized: Dict[str, Any] = {}
+    changed = False
+    for key, value in data.items():
+        canonical = lookup.get(_key_id(key), key)
+        if canonical != key:
+            changed = True
+        if canonical in normalized and canonical != key:
+            continue
+        normalized[canonical] = value
+
+    truncated = bool(partial_keys) and all(key in normalized for key in partial_keys)
+    for key, spec in schema.items():
+        if key not in normalized:
+            if spec["required"]:
+                raise SchemaError(f"Response is missing the '{key}' key")
+            normalized[key] = copy.deepcopy(spec["default"])
+            changed = changed or not truncated
+            continue
+        value = coerce(normalized[key], spec, key)
+        if value is not normalized[key]:
+            changed = True
+        normalized[key] = value
+    return normalized, changed
+
+
+def parse_response(agent: str, method: str, text: str, partial_keys: Optional[List[str]] = None) -> Tuple[Dict[str, Any], bool]:
+    """Parse and validate the JSON response of an agent method.
+
+    `partial_keys` are the keys a streamed response may have been cut off after (see validate).
+    Returns the data and whether a local repair was applied. Raises SchemaError if the response
+    cannot be repaired.
+    """
+    data, repaired = load_lenient(text)
+    schema = SCHEMAS.get(f"{agent}.{method}")
+    if schema is None:
+        if not isinstance(data, dict):
+            raise SchemaError(f"Response should be a JSON object, got {type(data).__name__}")
+        return data, repaired
+    data, changed = validate(data, schema, partial_keys)
+    return data, repaired or changed
+
+
+def describe_schema(agent: str, method: str) -> str:
+    """Describe the expected keys of a response for a re-ask prompt."""
+    schema = SCHEMAS.get(f"{agent}.{method}", {})
+    return ", ".join(f"'{key}' ({spec['type'].__name__})" for key, spec in schema.items())
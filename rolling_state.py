@@ -0,0 +1,74 @@
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import config
+
+FACT_PATTERNS = [
+    re.compile(r"^\d+/(tcp|udp)\s+open\b.*", re.IGNORECASE),
+    re.compile(r".*\bVULNERABLE\b.*"),
+    re.compile(r".*\bCVE-\d{4}-\d{4,}\b.*", re.IGNORECASE),
+    re.compile(r"^\s*\S+\s+(Disk|IPC|Printer)\b.*"),
+    re.compile(r".*\b(Host is up|OS details:|Service Info:|Running:).*"),
+    re.compile(r".*\b(NT_STATUS_\w+|Anonymous login successful|Login successful|session setup failed)\b.*", re.IGNORECASE),
+    re.compile(r".*\b(password|credentials?)\b.*\b(found|valid)\b.*", re.IGNORECASE),
+]
+
+
+def extract_facts(output: str) -> List[str]:
+    """Extract lines that look like key findings from command output."""
+    facts = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line or len(line) > 300:
+            continue
+        if any(pattern.match(line) for pattern in FACT_PATTERNS):
+            facts.append(line)
+    return facts
+
+
+class RollingState:
+    """Short, bounded summary of what has been executed and found so far in a run."""
+
+    def __init__(self, max_commands: int = config.MONITOR_STATE_MAX_COMMANDS, max_facts: int = config.MONITOR_STATE_MAX_FACTS):
+        """Create an empty state."""
+        self.max_commands = max_commands
+        self.max_facts = max_facts
+        self.total_commands = 0
+        self.commands: List[Tuple[str, Optional[int]]] = []
+        self.facts: "OrderedDict[str, None]" = OrderedDict()
+
+    def record(self, command: str, exit_status: Optional[int], output: str, facts: Optional[List[str]] = None) -> None:
+        """Record an executed command and the key facts found in its output, plus any facts already extracted by a parser."""
+        self.total_commands += 1
+        self.commands.append((command, exit_status))
+        del self.commands[:-self.max_commands]
+        for fact in extract_facts(output) + (facts or []):
+            self.facts.pop(fact, None)
+            self.facts[fact] = None
+        while len(self.facts) > self.max_facts:
+            self.facts.popitem(last=False)
+
+    def render(self) -> str:
+        """Render the state as text for a prompt."""
+        lines = [f"Commands executed so far: {self.total_commands}"]
+        if self.total_commands > len(self.commands):
+            lines.append(f"Most recent {len(self.commands)} commands:")
+        for command, exit_status in self.commands:
+            lines.append(f"- {command} (exit status: {exit_status})")
+        if self.facts:
+            lines.append("Key facts so far:")
+            lines.extend(f"- {fact}" for fact in self.facts)
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the state, e.g. for a checkpoint."""
+        return {"total_commands": self.total_commands, "commands": self.commands, "facts": list(self.facts)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RollingState":
+        """Rebuild a state serialized with to_dict."""
+        state = cls()
+        state.total_commands = data.get("total_commands", 0)
+        state.commands = [(command, exit_status) for command, exit_status in data.get("commands", [])]
+        state.facts = OrderedDict((fact, None) for fact in data.get("facts", []))
+        return state
@@ -0,0 +1,213 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, IO, List, Optional
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+LOG_EXTENSION = ".jsonl"
+LEGACY_LOG_EXTENSION = ".json"
+BLOB_DIR = "blobs"
+RAW_DIR = "raw"
+BLOB_EXTENSION = ".z"
+
+_STOP = object()
+
+
+class RunLogWriter:
+    """Background writer that appends JSON lines to run log files with batched fsync."""
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        """Start the writer thread."""
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._files: Dict[str, IO[str]] = {}
+        self._thread = threading.Thread(target=self._run, name="run-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path: str, entry: Dict[str, Any]) -> None:
+        """Queue an entry to be appended to a log file."""
+        self._queue.put((path, json.dumps(entry, ensure_ascii=False)))
+
+    def write_blob(self, path: str, data: bytes) -> None:
+        """Queue a blob to be written atomically; entries queued afterwards are written after it."""
+        self._queue.put((path, data))
+
+    def flush(self) -> None:
+        """Block until every queued entry has been written and synced."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Flush pending entries, stop the writer thread and close all files."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _get_file(self, path: str) -> IO[str]:
+        log_file = self._files.get(path)
+        if log_file is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            log_file = open(path, "a", encoding="utf-8")
+            self._files[path] = log_file
+        return log_file
+
+    def _write_blob(self, path: str, data: bytes) -> None:
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and item is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            dirty = set()
+            for item in batch:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                path, payload = item
+                try:
+                    if isinstance(payload, bytes):
+                        self._write_blob(path, payload)
+                    else:
+                        self._get_file(path).write(payload + "\n")
+                        dirty.add(path)
+                except Exception as e:
+                    logger.error(f"Error writing run log {path}: {str(e)}")
+            for path in dirty:
+                try:
+                    log_file = self._files[path]
+                    log_file.flush()
+                    os.fsync(log_file.fileno())
+                except Exception as e:
+                    logger.error(f"Error syncing run log {path}: {str(e)}")
+            for _ in batch:
+                self._queue.task_done()
+
+        for log_file in self._files.values():
+            log_file.close()
+        self._files.clear()
+
+
+class BlobStore:
+    """Content-addressed store of compressed chat messages shared by all logs of a run."""
+
+    def __init__(self, run_dir: str):
+        """Create a store rooted at the run's blob directory."""
+        self.root = os.path.join(run_dir, BLOB_DIR)
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest + BLOB_EXTENSION)
+
+    def put(self, message: Dict[str, Any]) -> str:
+        """Store a message once and return its hash."""
+        text = json.dumps(message, ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest in self._known:
+                return digest
+            self._known.add(digest)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            get_writer().write_blob(path, zlib.compress(text.encode("utf-8"), config.LOG_BLOB_COMPRESSION_LEVEL))
+        return digest
+
+    def get(self, digest: str) -> Dict[str, Any]:
+        """Load a message by its hash."""
+        return _load_blob(self._path(digest))
+
+    def resolve(self, digests: List[str]) -> List[Dict[str, Any]]:
+        """Rebuild a message list from its hashes."""
+        return [self.get(digest) for digest in digests]
+
+
+@lru_cache(maxsize=4096)
+def _load_blob(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return json.loads(zlib.decompress(f.read()).decode("utf-8"))
+
+
+_blob_stores: Dict[str, BlobStore] = {}
+_writer: Optional[RunLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> RunLogWriter:
+    """Get the process-wide run log writer."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = RunLogWriter(config.LOG_BATCH_SIZE, config.LOG_FLUSH_INTERVAL)
+            atexit.register(_writer.close)
+        return _writer
+
+
+def get_blob_store(run_dir: str) -> BlobStore:
+    """Get the blob store of a run directory."""
+    with _writer_lock:
+        store = _blob_stores.get(run_dir)
+        if store is None:
+            store = BlobStore(run_dir)
+            _blob_stores[run_dir] = store
+        return store
+
+
+def read_log(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read a run log file into a mapping of request name to entry details.
+
+    Supports the append-only JSONL format as well as the older single JSON document format.
+    Entries in the JSONL format reference their context by hash in "ContextRefs"; use
+    BlobStore.resolve to rebuild it when needed.
+    """
+    if path.endswith(LEGACY_LOG_EXTENSION):
+        with open(path, "r") as f:
+            data = json.load(f)
+        # Other run artifacts (summaries, stats) share the .json extension
+        if not isinstance(data, dict):
+            return {}
+        return {request: details for request, details in data.items() if request.startswith("Request ") and isinstance(details, dict)}
+
+    data: Dict[str, Dict[str, Any]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be incomplete if the run is still being written.
+                continue
+            request = entry.pop("Request", f"Request {len(data) + 1}")
+            data[request] = entry
+    return data
@@ -0,0 +1,85 @@
+import contextvars
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+import logging
+from agent import Agent
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def job_log_subdir(target: str) -> str:
+    """Turn a target into a directory name under the run's log directory."""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", target)
+
+
+def assign_log_subdirs(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Give every job a unique log subdirectory, keeping subdirectories that are already assigned."""
+    seen: Dict[str, int] = {}
+    assigned = []
+    for job in jobs:
+        subdir = job.get("log_subdir") or job_log_subdir(job["target"])
+        seen[subdir] = seen.get(subdir, 0) + 1
+        if seen[subdir] > 1:
+            subdir = f"{subdir}_{seen[subdir]}"
+        assigned.append({**job, "log_subdir": subdir})
+    return assigned
+
+
+def run_job(job: Dict[str, Any], run_engagement: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+    """Run one scan job and return its summary; errors are recorded instead of raised."""
+    summary: Dict[str, Any] = {"target": job["target"], "description": job["description"], "log_subdir": job["log_subdir"]}
+    start = time.time()
+    try:
+        logger.info(f"Starting engagement for {job['target']}")
+        summary.update(run_engagement(job))
+        summary["status"] = "completed"
+    except Exception as e:
+        logger.error(f"Engagement for {job['target']} failed: {str(e)}")
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+    summary["duration_seconds"] = round(time.time() - start, 1)
+    return summary
+
+
+def write_summary(summaries: List[Dict[str, Any]], run_dir: str) -> None:
+    """Write the combined summary of all jobs of a run as JSON and Markdown."""
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, "summary.json"), "w") as f:
+        json.dump(summaries, f, indent=2)
+
+    lines = [
+        f"# Scan Summary: {os.path.basename(run_dir)}",
+        "",
+        "| Target | Status | Satisfactory | Iterations | Duration (s) | Report |",
+        "|---|---|---|---|---|---|"
+    ]
+    for summary in summaries:
+        satisfactory = "Yes" if summary.get("satisfactory") else "No"
+        report = summary.get("report_file") or summary.get("error", "")
+        lines.append(f"| {summary['target']} | {summary['status']} | {satisfactory} | {summary.get('iterations', 0)} | {summary['duration_seconds']} | {report} |")
+    with open(os.path.join(run_dir, "summary.md"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def run_jobs(jobs: List[Dict[str, Any]], run_engagement: Callable[[Dict[str, Any]], Dict[str, Any]], max_concurrent_jobs: int) -> List[Dict[str, Any]]:
+    """Run scan jobs concurrently, each logging to context_logs/runN/<target>, and write a combined summary.
+
+    Global limits on concurrent LLM requests and SSH sessions are enforced by llm_client and
+    ssh_pool, so they hold across all jobs.
+    """
+    scheduled = assign_log_subdirs(jobs)
+    logger.info(f"Scheduling {len(scheduled)} scan jobs with up to {max_concurrent_jobs} running at once")
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="scan-job") as executor:
+        # Run each job in a copy of the caller's context so its spans nest under the caller's span
+        futures = [executor.submit(contextvars.copy_context().run, run_job, job, run_engagement) for job in scheduled]
+        summaries = [future.result() for future in futures]
+
+    run_dir = os.path.join(config.LOG_DIR, f"run{Agent.run_number}")
+    write_summary(summaries, run_dir)
+    print(f"Scan summary saved to {os.path.join(run_dir, 'summary.md')}")
+    return summaries
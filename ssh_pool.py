@@ -0,0 +1,128 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+import paramiko
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _host_key(host_config: Dict[str, Any]) -> str:
+    return f"{host_config.get('username', '')}@{host_config['hostname']}:{host_config.get('port', 22)}"
+
+
+class SSHConnectionPool:
+    """Pool of keep-alive SSH connections to one or more worker hosts."""
+
+    def __init__(self, hosts: List[Dict[str, Any]], keepalive_interval: int):
+        """Create a pool for the given worker host configurations."""
+        if not hosts:
+            raise ValueError("SSHConnectionPool needs at least one host")
+        self.hosts = hosts
+        self.keepalive_interval = keepalive_interval
+        self._idle: Dict[str, List[paramiko.SSHClient]] = {_host_key(host): [] for host in hosts}
+        self._in_use: Dict[str, int] = {_host_key(host): 0 for host in hosts}
+        self._owners: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_alive(ssh: paramiko.SSHClient) -> bool:
+        """Check that a connection's transport is still usable."""
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _connect(self, host_config: Dict[str, Any]) -> paramiko.SSHClient:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(**host_config)
+        transport = ssh.get_transport()
+        if transport is not None and self.keepalive_interval:
+            transport.set_keepalive(self.keepalive_interval)
+        logger.info(f"Connected to SSH server {_host_key(host_config)}")
+        return ssh
+
+    def acquire(self) -> paramiko.SSHClient:
+        """Get a live connection to the least busy worker host, reconnecting if needed."""
+        with self._lock:
+            host_config = min(self.hosts, key=lambda host: self._in_use[_host_key(host)])
+            key = _host_key(host_config)
+            self._in_use[key] += 1
+            idle = self._idle[key]
+            ssh = idle.pop() if idle else None
+
+        try:
+            while ssh is not None and not self.is_alive(ssh):
+                logger.info(f"Dropping dead SSH connection to {key}")
+                ssh.close()
+                with self._lock:
+                    ssh = self._idle[key].pop() if self._idle[key] else None
+            if ssh is None:
+                ssh = self._connect(host_config)
+        except Exception:
+            with self._lock:
+                self._in_use[key] -= 1
+            raise
+
+        with self._lock:
+            self._owners[id(ssh)] = key
+        return ssh
+
+    def release(self, ssh: paramiko.SSHClient) -> None:
+        """Return a connection to the pool, closing it if it is no longer alive."""
+        with self._lock:
+            key = self._owners.pop(id(ssh), None)
+            if key is None:
+                return
+            self._in_use[key] -= 1
+            if self.is_alive(ssh):
+                self._idle[key].append(ssh)
+                return
+        ssh.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[paramiko.SSHClient]:
+        """Borrow a connection for the duration of a with block."""
+        ssh = self.acquire()
+        try:
+            yield ssh
+        finally:
+            self.release(ssh)
+
+    def close_all(self) -> None:
+        """Close every idle connection."""
+        with self._lock:
+            for idle in self._idle.values():
+                for ssh in idle:
+                    ssh.close()
+                idle.clear()
+        logger.info("SSH connection pool closed.")
+
+
+_pool: Optional[SSHConnectionPool] = None
+_pool_lock = threading.Lock()
+_session_semaphore = threading.BoundedSemaphore(config.SSH_MAX_SESSIONS)
+
+
+@contextmanager
+def session_slot() -> Iterator[None]:
+    """Hold one of the SSH_MAX_SESSIONS command sessions shared by all scan jobs."""
+    with _session_semaphore:
+        yield
+
+
+def get_pool() -> SSHConnectionPool:
+    """Get the process-wide SSH connection pool for config.SSH_CONFIG and config.SSH_WORKER_HOSTS."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHConnectionPool([config.SSH_CONFIG, *config.SSH_WORKER_HOSTS], config.SSH_KEEPALIVE_INTERVAL)
+            atexit.register(_pool.close_all)
+        return _pool
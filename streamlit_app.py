@@ -4,6 +4,7 @@ import os
 import ast
 import subprocess
 import signal
+import run_log
 
 # Load and save system messages
 def load_system_messages():
@@ -34,30 +35,51 @@ div[data-testid="stHorizontalBlock"] > div:nth-child(2) button {
 """, unsafe_allow_html=True)
 
 def load_json_files(run_path):
-    json_files = [f for f in os.listdir(run_path) if f.endswith('.json')]
+    log_files = [f for f in os.listdir(run_path) if f.endswith((run_log.LOG_EXTENSION, run_log.LEGACY_LOG_EXTENSION))]
     data = {}
-    for file in json_files:
+    for file in log_files:
         agent_name = file.split('.')[0]
-        with open(os.path.join(run_path, file), 'r') as f:
-            data[agent_name] = json.load(f)
+        data.setdefault(agent_name, {}).update(run_log.read_log(os.path.join(run_path, file)))
     return data
 
-def extract_messages(data):
+def list_run_folders(log_dir):
+    # Multi-target runs keep each target's logs in runN/<target>
+    run_folders = []
+    for run in sorted(os.listdir(log_dir)):
+        run_path = os.path.join(log_dir, run)
+        if not os.path.isdir(run_path):
+            continue
+        run_folders.append(run)
+        for target in sorted(os.listdir(run_path)):
+            if target not in (run_log.BLOB_DIR, run_log.RAW_DIR) and os.path.isdir(os.path.join(run_path, target)):
+                run_folders.append(os.path.join(run, target))
+    return run_folders
+
+def extract_messages(data, run_path=None):
     messages = []
     for agent, content in data.items():
         for request, details in content.items():
             order = details.get('Order', 0)
             context = details.get('Context', [])
+            context_refs = details.get('ContextRefs', [])
             response = details.get('Response', '')
             messages.append({
                 'order': order,
                 'agent': agent,
                 'request': request,
                 'context': context,
+                'context_refs': context_refs,
+                'run_path': run_path,
                 'response': response
             })
     return sorted(messages, key=lambda x: x['order'])
 
+def load_context(msg):
+    # Contexts of JSONL logs are stored once per message in the run's blob store
+    if msg['context'] or not msg['context_refs']:
+        return msg['context']
+    return run_log.get_blob_store(msg['run_path']).resolve(msg['context_refs'])
+
 def parse_response(response):
     try:
         parsed = json.loads(response)
@@ -72,9 +94,9 @@ def parse_response(response):
 def display_message(msg):
     st.markdown(f"<div class='bordered-box'><h3>{msg['agent']}: {msg['request']}</h3>", unsafe_allow_html=True)
     
-    if msg['context']:
+    if msg['context'] or msg['context_refs']:
         with st.expander("Show Context"):
-            for item in msg['context']:
+            for item in load_context(msg):
                 st.markdown(f"<div class='bordered-box'><strong>{item['role']}:</strong> {item['content']}</div>", unsafe_allow_html=True)
     
     parsed_response = parse_response(msg['response'])
@@ -139,10 +161,10 @@ def config_ui():
                 st.subheader(key)
                 updated_dict = {}
                 for k, v in value.items():
-                    updated_dict[k] = st.text_input(f"{key}.{k}", v)
+                    updated_dict[k] = st.text_input(f"{key}.{k}", str(v))
                 updated_config[key] = updated_dict
             else:
-                updated_config[key] = st.text_input(key, value)
+                updated_config[key] = st.text_input(key, str(value))
     
     if st.button("Update Configuration"):
         new_content = "import os\n\n"
@@ -150,9 +172,12 @@ def config_ui():
             if isinstance(value, dict):
                 new_content += f"{key} = {{\n"
                 for k, v in value.items():
-                    new_content += f"    '{k}': '{v}',\n"
+                    if isinstance(config[key].get(k), str):
+                        new_content += f"    '{k}': '{v}',\n"
+                    else:
+                        new_content += f"    '{k}': {v},\n"
                 new_content += "}\n\n"
-            elif key in ['OPENAI_MODEL', 'TARGET_IP', 'SCAN_DESCRIPTION', 'LOG_DIR', 'FINDINGS_FILE', 'REPORT_FILE']:
+            elif key in ['OPENAI_MODEL', 'TARGET_IP', 'SCAN_DESCRIPTION', 'LOG_DIR', 'FINDINGS_FILE', 'REPORT_FILE', 'LLM_CACHE_PATH', 'MONITOR_MODE', 'MODEL_ROUTING_FILE']:
                 new_content += f"{key} = '{value}'\n"
             else:
                 new_content += f"{key} = {value}\n"
@@ -218,6 +243,45 @@ def stop_main_script():
         st.session_state['process'] = None
         st.session_state['running'] = False
 
+def metrics_ui():
+    st.header("Run Metrics")
+    log_dir = "context_logs"
+    runs = [f for f in sorted(os.listdir(log_dir)) if os.path.isfile(os.path.join(log_dir, f, 'metrics.json'))] if os.path.isdir(log_dir) else []
+    if not runs:
+        st.info("No metrics found. Metrics are written to context_logs/runN/metrics.json at the end of a run.")
+        return
+    selected_run = st.sidebar.selectbox("Select Run", runs, index=len(runs) - 1, key="metrics_run_selector")
+    with open(os.path.join(log_dir, selected_run, 'metrics.json'), 'r') as f:
+        data = json.load(f)
+
+    totals = data.get('totals', {})
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("LLM calls", totals.get('llm_calls', 0))
+    col2.metric("LLM time (s)", f"{totals.get('llm_wall_time_seconds', 0):.1f}")
+    col3.metric("Estimated cost (USD)", f"{totals.get('cost_usd', 0):.4f}")
+    col4.metric("Retries", totals.get('retries', 0))
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Prompt tokens", totals.get('prompt_tokens', 0))
+    col2.metric("Completion tokens", totals.get('completion_tokens', 0))
+    col3.metric("Cached tokens", totals.get('cached_tokens', 0))
+    col4.metric("SSH time (s)", f"{totals.get('command_time_seconds', 0):.1f}")
+
+    agents = data.get('agents', [])
+    if agents:
+        st.subheader("Prompt cache hit rate by agent")
+        st.bar_chart({a['agent']: a['cached_token_rate'] for a in agents})
+
+    llm_calls = data.get('llm_calls', [])
+    if llm_calls:
+        st.subheader("LLM calls by agent and method")
+        st.dataframe(llm_calls, use_container_width=True)
+        st.bar_chart({f"{c['agent']}.{c['method']}" + (f" ({c['target']})" if c['target'] else ""): c['wall_time_seconds'] for c in llm_calls})
+
+    commands = data.get('commands', [])
+    if commands:
+        st.subheader("SSH commands")
+        st.dataframe(commands, use_container_width=True)
+
 def agent_config_ui():
     st.header("Agent Configuration")
     system_messages = load_system_messages()
@@ -240,13 +304,13 @@ def main():
         st.session_state['running'] = False
 
     # Sidebar for navigation
-    page = st.sidebar.radio("Navigation", ["Conversation", "Configuration", "Agent Configuration"])
+    page = st.sidebar.radio("Navigation", ["Conversation", "Metrics", "Configuration", "Agent Configuration"])
 
     if page == "Conversation":
         # Sidebar for run selection
         st.sidebar.header("Select Run")
         log_dir = "context_logs"
-        run_folders = [f for f in os.listdir(log_dir) if os.path.isdir(os.path.join(log_dir, f))]
+        run_folders = list_run_folders(log_dir)
         selected_run = st.sidebar.selectbox("Select Run", run_folders, key="run_selector")
         
         # Add Start and Stop buttons in the sidebar
@@ -265,12 +329,14 @@ def main():
         if selected_run:
             run_path = os.path.join(log_dir, selected_run)
             data = load_json_files(run_path)
-            messages = extract_messages(data)
+            messages = extract_messages(data, run_path)
 
             st.header(f"Conversation from Run: {selected_run}")
             for msg in messages:
                 display_message(msg)
 
+    elif page == "Metrics":
+        metrics_ui()
     elif page == "Configuration":
         config_ui()
     else:
@@ -0,0 +1,125 @@
+import re
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# CSI (ESC [ ... final), OSC (ESC ] ... BEL or ST) and two-character escape sequences
+ESCAPE_SEQUENCE = re.compile(r"\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\^_`a-z{|}~=>()*+][0-9A-Za-z]?)")
+INCOMPLETE_ESCAPE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*)?$")
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x07\x0b\x0c\x0e-\x1f\x7f]")
+PROGRESS_LINE = re.compile(r"\d+(?:\.\d+)?\s?%|\bETA\b|\belapsed\b|\[[#=>\-. ]{5,}\]|[█▉▊▋▌▍▎▏━]{3,}", re.IGNORECASE)
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+class TerminalNormalizer:
+    """Incrementally turns a PTY transcript into plain text.
+
+    Carriage returns and backspaces overwrite the current line as a terminal would, escape
+    sequences are removed, and runs of identical lines or of progress lines that differ only in
+    their numbers are collapsed into the first and last line and a count of the lines in between.
+    Collapsing can be turned off for machine-readable output (e.g. XML), where repeated lines such
+    as consecutive closing tags are significant.
+    """
+
+    def __init__(self, collapse_runs: bool = True):
+        """Create a normalizer with an empty transcript."""
+        self.collapse_runs = collapse_runs
+        self.lines: List[str] = []
+        self._line: List[str] = []
+        self._cursor = 0
+        self._pending = ""
+        self._run_first: Optional[str] = None
+        self._run_last: Optional[str] = None
+        self._run_key: Optional[str] = None
+        self._run_length = 0
+
+    def feed(self, text: str) -> None:
+        """Process the next chunk of decoded terminal output."""
+        text = self._pending + text
+        # Keep an escape sequence split across chunks until the rest of it arrives
+        incomplete = INCOMPLETE_ESCAPE.search(text)
+        if incomplete and incomplete.group(0):
+            self._pending = text[incomplete.start():]
+            text = text[:incomplete.start()]
+        else:
+            self._pending = ""
+
+        position = 0
+        for match in ESCAPE_SEQUENCE.finditer(text):
+            self._write(text[position:match.start()])
+            if match.group(2) == "K":
+                self._erase_line(match.group(1))
+            position = match.end()
+        self._write(text[position:])
+
+    def finish(self) -> str:
+        """Return the normalized transcript, including an unterminated last line such as a prompt."""
+        self._pending = ""
+        self._flush_run()
+        lines = list(self.lines)
+        partial = "".join(self._line)
+        return "\n".join(lines) + ("\n" if lines else "") + partial
+
+    def _write(self, text: str) -> None:
+        for char in text:
+            if char == "\n":
+                self._commit_line("".join(self._line).rstrip())
+                self._line, self._cursor = [], 0
+            elif char == "\r":
+                self._cursor = 0
+            elif char == "\b":
+                self._cursor = max(self._cursor - 1, 0)
+            elif char == "\t" or not CONTROL_CHARACTERS.match(char):
+                if self._cursor < len(self._line):
+                    self._line[self._cursor] = char
+                else:
+                    self._line.append(char)
+                self._cursor += 1
+
+    def _erase_line(self, parameter: str) -> None:
+        if parameter in ("", "0"):
+            del self._line[self._cursor:]
+        elif parameter == "1":
+            self._line[:self._cursor] = [" "] * min(self._cursor, len(self._line))
+        elif parameter == "2":
+            self._line = [" "] * self._cursor
+
+    def _commit_line(self, line: str) -> None:
+        if not self.collapse_runs:
+            self.lines.append(line)
+            return
+        if PROGRESS_LINE.search(line):
+            key = "progress:" + NUMBER.sub("#", line)
+        else:
+            key = "line:" + line
+        if key == self._run_key:
+            self._run_last = line
+            self._run_length += 1
+            return
+        self._flush_run()
+        self._run_key, self._run_first, self._run_last, self._run_length = key, line, line, 1
+
+    def _flush_run(self) -> None:
+        if self._run_key is None:
+            return
+        if self._run_first == "":
+            self.lines.append("")
+        elif self._run_length == 1:
+            self.lines.append(self._run_first)
+        elif self._run_key.startswith("line:"):
+            self.lines.append(self._run_first)
+            self.lines.append(f"[previous line repeated {self._run_length - 1} more times]")
+        else:
+            self.lines.append(self._run_first)
+            if self._run_length > 2:
+                self.lines.append(f"[{self._run_length - 2} similar progress lines omitted]")
+            self.lines.append(self._run_last)
+        self._run_key = None
+
+
+def normalize(text: str, collapse_runs: bool = True) -> str:
+    """Normalize a complete terminal transcript."""
+    normalizer = TerminalNormalizer(collapse_runs)
+    normalizer.feed(text)
+    return normalizer.finish()
@@ -0,0 +1,285 @@
+import json
+import os
+import re
+import shlex
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MACHINE_FORMAT_OPTION = "-oX -"
+COMMAND_PREFIXES = {"sudo", "timeout", "proxychains", "proxychains4", "env", "nice", "stdbuf"}
+
+NMAP_REPORT = re.compile(r"^Nmap scan report for (?:(\S+) \(([^)]+)\)|(\S+))")
+NMAP_PORT = re.compile(r"^(\d+)/(tcp|udp|sctp)\s+(\S+)\s+(\S+)(?:\s+(.*))?$")
+NMAP_SCRIPT = re.compile(r"^\|[_ ]?\s?(.*)$")
+NMAP_SCRIPT_START = re.compile(r"^([\w.-]+):\s?(.*)$")
+SHARE_LINE = re.compile(r"^\s*(\S.*?)\s+(Disk|IPC|Printer)\s*(.*)$")
+SMB_FILE_LINE = re.compile(r"^\s{2}(.+?)\s+([ADHNRS]+)\s+(\d+)\s+\w{3} \w{3}\s+\d+ [\d:]+ \d{4}$")
+NT_STATUS = re.compile(r"\bNT_STATUS_\w+\b")
+ENUM4LINUX_ACCOUNT = re.compile(r"^(user|group):\[([^\]]*)\] rid:\[([^\]]*)\]")
+ENUM4LINUX_SHARE_ACCESS = re.compile(r"^//\S+/(\S+)\s+Mapping: ([^,\s]+),? Listing: (\S+)")
+ENUM4LINUX_FIELDS = {
+    "domain": re.compile(r"^\[\+\] Got domain/workgroup name: (.+)$|^Domain Name: (.+)$"),
+    "domain_sid": re.compile(r"^Domain Sid: (.+)$"),
+    "os": re.compile(r"OS=\[([^\]]+)\]"),
+    "server": re.compile(r"Server=\[([^\]]+)\]"),
+}
+PASSWORD_POLICY = re.compile(r"^\s*(Minimum password length|Password history length|Maximum password age|Minimum password age|Account Lockout Threshold|Password Complexity Flags|Locked Account Duration): (.+)$")
+
+
+def tool_name(command: str) -> str:
+    """Get the name of the program a command line runs, skipping wrappers such as sudo and timeout."""
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        tokens = command.split()
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if "=" in token and not token.startswith("-"):
+            index += 1
+        elif os.path.basename(token) in COMMAND_PREFIXES:
+            index += 1
+            # Skip the wrapper's own options and a duration argument (timeout 60 nmap ...)
+            while index < len(tokens) and (tokens[index].startswith("-") or re.fullmatch(r"\d+[smhd]?", tokens[index])):
+                index += 1
+        else:
+            return os.path.basename(token)
+    return ""
+
+
+def is_simple_command(command: str) -> bool:
+    """Check if a command line runs a single program, without pipes, redirects, lists (&&, ||, ;) or subshells."""
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    try:
+        return not any(token and set(token) <= set("();<>|&") for token in lexer)
+    except ValueError:
+        return False
+
+
+def request_machine_format(command: str) -> str:
+    """Ask nmap for XML on stdout when a simple command does not choose an output format itself."""
+    if tool_name(command) != "nmap" or not is_simple_command(command) or re.search(r"\s-o[NXGSA]", command):
+        return command
+    return re.sub(r"\bnmap\b", f"nmap {MACHINE_FORMAT_OPTION}", command, count=1)
+
+
+def writes_machine_format(command: str) -> bool:
+    """Check if a command writes machine-readable output (nmap XML) to the terminal."""
+    return re.search(r"\s-oX\s+-(\s|$)", command) is not None
+
+
+def parse_nmap_xml(text: str) -> Optional[Dict[str, Any]]:
+    """Parse nmap -oX output."""
+    start = text.find("<nmaprun")
+    end = text.rfind("</nmaprun>")
+    if start == -1 or end == -1:
+        return None
+    try:
+        root = ET.fromstring(text[start:end + len("</nmaprun>")])
+    except ET.ParseError as e:
+        logger.warning(f"Could not parse nmap XML output: {str(e)}")
+        return None
+
+    hosts = []
+    for host in root.iter("host"):
+        status = host.find("status")
+        record: Dict[str, Any] = {
+            "address": next((address.get("addr") for address in host.iter("address") if address.get("addrtype") in ("ipv4", "ipv6")), None),
+            "hostnames": [hostname.get("name") for hostname in host.iter("hostname")],
+            "status": status.get("state") if status is not None else None,
+            "ports": []
+        }
+        for port in host.iter("port"):
+            state = port.find("state")
+            service = port.find("service")
+            entry: Dict[str, Any] = {
+                "port": int(port.get("portid", 0)),
+                "protocol": port.get("protocol"),
+                "state": state.get("state") if state is not None else None
+            }
+            if service is not None:
+                for key in ("name", "product", "version", "extrainfo"):
+                    if service.get(key):
+                        entry["service" if key == "name" else key] = service.get(key)
+            scripts = {script.get("id"): (script.get("output") or "").strip() for script in port.iter("script")}
+            if scripts:
+                entry["scripts"] = scripts
+            record["ports"].append(entry)
+        host_scripts = host.find("hostscript")
+        if host_scripts is not None:
+            record["host_scripts"] = {script.get("id"): (script.get("output") or "").strip() for script in host_scripts.iter("script")}
+        os_matches = [match.get("name") for match in host.iter("osmatch")][:3]
+        if os_matches:
+            record["os"] = os_matches
+        hosts.append(record)
+    return {"hosts": hosts}
+
+
+def parse_nmap_text(text: str) -> Optional[Dict[str, Any]]:
+    """Parse nmap's normal (human readable) output."""
+    hosts: List[Dict[str, Any]] = []
+    host: Optional[Dict[str, Any]] = None
+    scripts: Optional[Dict[str, str]] = None
+    script_id: Optional[str] = None
+    for line in text.splitlines():
+        line = line.rstrip()
+        match = NMAP_REPORT.match(line)
+        if match:
+            hostname, address, bare_address = match.groups()
+            host = {"address": address or bare_address, "hostnames": [hostname] if hostname else [], "status": "up", "ports": []}
+            hosts.append(host)
+            scripts, script_id = None, None
+            continue
+        if host is None:
+            continue
+        match = NMAP_PORT.match(line)
+        if match:
+            port, protocol, state, service, version = match.groups()
+            entry: Dict[str, Any] = {"port": int(port), "protocol": protocol, "state": state, "service": service}
+            if version:
+                entry["version"] = version.strip()
+            host["ports"].append(entry)
+            scripts, script_id = entry.setdefault("scripts", {}), None
+            continue
+        if line.startswith("Host script results:"):
+            scripts, script_id = host.setdefault("host_scripts", {}), None
+            continue
+        match = NMAP_SCRIPT.match(line)
+        if match and scripts is not None:
+            content = match.group(1)
+            start = NMAP_SCRIPT_START.match(content) if not line.startswith("|  ") else None
+            if start:
+                script_id = start.group(1)
+                scripts[script_id] = start.group(2).strip()
+            elif script_id:
+                scripts[script_id] = f"{scripts[script_id]}\n{content.strip()}".strip()
+            continue
+        if line.startswith("OS details:"):
+            host["os"] = [line.split(":", 1)[1].strip()]
+        elif line.startswith("Service Info:"):
+            host["service_info"] = line.split(":", 1)[1].strip()
+    for host in hosts:
+        for entry in host["ports"]:
+            if not entry.get("scripts"):
+                entry.pop("scripts", None)
+    return {"hosts": hosts} if hosts else None
+
+
+def parse_nmap(text: str) -> Optional[Dict[str, Any]]:
+    """Parse nmap output in XML or normal format."""
+    return parse_nmap_xml(text) or parse_nmap_text(text)
+
+
+def parse_shares(text: str) -> List[Dict[str, str]]:
+    """Parse an SMB share listing table (Sharename / Type / Comment)."""
+    shares = []
+    for line in text.splitlines():
+        match = SHARE_LINE.match(line)
+        if match and match.group(1) not in ("Sharename", "---------"):
+            shares.append({"name": match.group(1), "type": match.group(2), "comment": match.group(3).strip()})
+    return shares
+
+
+def parse_smbclient(text: str) -> Optional[Dict[str, Any]]:
+    """Parse smbclient share listings and directory listings."""
+    record: Dict[str, Any] = {}
+    shares = parse_shares(text)
+    if shares:
+        record["shares"] = shares
+    files = [
+        {"name": match.group(1), "attributes": match.group(2), "size": int(match.group(3))}
+        for match in (SMB_FILE_LINE.match(line) for line in text.splitlines()) if match
+    ]
+    if files:
+        record["files"] = files
+    if "Anonymous login successful" in text:
+        record["anonymous_login"] = True
+    errors = sorted(set(NT_STATUS.findall(text)))
+    if errors:
+        record["errors"] = errors
+    return record or None
+
+
+def parse_enum4linux(text: str) -> Optional[Dict[str, Any]]:
+    """Parse enum4linux output: domain and OS information, users, groups, shares and password policy."""
+    record: Dict[str, Any] = {}
+    users, groups, share_access, policy = [], [], [], {}
+    for line in text.splitlines():
+        line = line.strip()
+        match = ENUM4LINUX_ACCOUNT.match(line)
+        if match:
+            (users if match.group(1) == "user" else groups).append({"name": match.group(2), "rid": match.group(3)})
+            continue
+        match = ENUM4LINUX_SHARE_ACCESS.match(line)
+        if match:
+            share_access.append({"share": match.group(1), "mapping": match.group(2), "listing": match.group(3)})
+            continue
+        match = PASSWORD_POLICY.match(line)
+        if match:
+            policy[match.group(1)] = match.group(2).strip()
+            continue
+        for key, pattern in ENUM4LINUX_FIELDS.items():
+            match = pattern.search(line)
+            if match and key not in record:
+                record[key] = next(group for group in match.groups() if group).strip()
+    shares = parse_shares(text)
+    for key, value in (("users", users), ("groups", groups), ("shares", shares), ("share_access", share_access), ("password_policy", policy)):
+        if value:
+            record[key] = value
+    errors = sorted(set(NT_STATUS.findall(text)))
+    if errors:
+        record["errors"] = errors
+    return record or None
+
+
+PARSERS: Dict[str, Callable[[str], Optional[Dict[str, Any]]]] = {
+    "nmap": parse_nmap,
+    "smbclient": parse_smbclient,
+    "enum4linux": parse_enum4linux,
+    "enum4linux.pl": parse_enum4linux,
+}
+
+
+def parse_output(command: str, output: str) -> Optional[Dict[str, Any]]:
+    """Parse the output of a known tool into a structured record, or return None."""
+    tool = tool_name(command)
+    parser = PARSERS.get(tool)
+    if parser is None:
+        return None
+    try:
+        parsed = parser(output)
+    except Exception as e:
+        logger.warning(f"Could not parse {tool} output: {str(e)}")
+        return None
+    if not parsed:
+        return None
+    return {"tool": tool, "command": command, **parsed}
+
+
+def render_record(record: Dict[str, Any], output: str) -> str:
+    """Render a parsed record as compact JSON, or keep the raw output if that is shorter."""
+    rendered = json.dumps(record, separators=(",", ":")) + "\n"
+    return rendered if len(rendered) < len(output) else output
+
+
+def record_facts(record: Dict[str, Any]) -> List[str]:
+    """Describe the key findings of a parsed record as short text lines."""
+    facts = []
+    for host in record.get("hosts", []):
+        for port in host.get("ports", []):
+            if port.get("state") == "open":
+                service = " ".join(str(port[key]) for key in ("service", "product", "version") if port.get(key))
+                facts.append(f"{host.get('address')} {port['port']}/{port['protocol']} open {service}".strip())
+            for script_id, output in port.get("scripts", {}).items():
+                if "VULNERABLE" in output:
+                    facts.append(f"{host.get('address')} {port['port']}/{port['protocol']} {script_id}: VULNERABLE")
+    for share in record.get("shares", []):
+        facts.append(f"share {share['name']} ({share['type']})")
+    for user in record.get("users", []):
+        facts.append(f"user {user['name']}")
+    if record.get("anonymous_login"):
+        facts.append("Anonymous login successful")
+    return facts
@@ -0,0 +1,110 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+TRACE_FILE = "trace.json"
+
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Collects nested timing spans and exports them in the Chrome/Perfetto trace event format."""
+
+    def __init__(self):
+        """Create an empty tracer."""
+        self._events: List[Dict[str, Any]] = []
+        self._thread_names: Dict[int, str] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def current_span_id(self) -> Optional[int]:
+        """Get the id of the innermost open span in the current context."""
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, category: str = "stage", parent_id: Optional[int] = None, **args: Any) -> Iterator[int]:
+        """Time a block as a span nested under the current span (or under `parent_id`).
+
+        Pass `parent_id` explicitly when the block runs on a different thread than its parent.
+        """
+        if not config.TRACING_ENABLED:
+            yield 0
+            return
+        span_id = next(self._ids)
+        parent = parent_id if parent_id is not None else _current_span.get()
+        token = _current_span.set(span_id)
+        thread = threading.current_thread()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield span_id
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end = time.perf_counter()
+            _current_span.reset(token)
+            event_args = {"span_id": span_id, "parent_id": parent, **args}
+            if error:
+                event_args["error"] = error
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) * 1_000_000,
+                "dur": (end - start) * 1_000_000,
+                "pid": self.pid,
+                "tid": thread.native_id,
+                "args": event_args
+            }
+            with self._lock:
+                self._events.append(event)
+                self._thread_names.setdefault(thread.native_id, thread.name)
+
+    def traced(self, category: str = "stage") -> Callable[[F], F]:
+        """Decorator that wraps every call of a function in a span named after it."""
+        def decorator(func: F) -> F:
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(func.__name__, category):
+                    return func(*args, **kwargs)
+            return wrapper  # type: ignore[return-value]
+        return decorator
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the collected spans as a Chrome trace document."""
+        with self._lock:
+            events = sorted(self._events, key=lambda event: event["ts"])
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._thread_names.items()
+            ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def write(self, run_dir: str) -> None:
+        """Write the trace of the run to trace.json in the run directory."""
+        if not config.TRACING_ENABLED:
+            return
+        os.makedirs(run_dir, exist_ok=True)
+        try:
+            with open(os.path.join(run_dir, TRACE_FILE), "w") as f:
+                json.dump(self.to_chrome_trace(), f)
+        except Exception as e:
+            logger.error(f"Error writing trace: {str(e)}")
+
+
+tracer = Tracer()